@@ -0,0 +1,346 @@
+import random
+import numpy as np
+from typing import List, Tuple, Optional, Sequence
+
+from misc import Point, Slope, VISION_8, DEATH_CAUSES, get_loop_hash_tables
+from neural_network import BatchFeedForwardNetwork
+
+
+POSSIBLE_DIRECTIONS = ('u', 'd', 'l', 'r')
+# Step taken by the head for each direction code (index into POSSIBLE_DIRECTIONS)
+_DX = np.array([0, 0, -1, 1], dtype=np.int64)
+_DY = np.array([-1, 1, 0, 0], dtype=np.int64)
+
+
+class BatchSnakeEnv(object):
+    """
+    Runs N games of snake in lockstep on NumPy arrays.
+
+    The rules are the same as Snake.update/Snake.move (moving into your own tail is allowed,
+    eating an apple grows the snake and a snake dies if it goes more than `starvation_limit`
+    frames without an apple), and apples are drawn from random.Random(apple_seed) in the same
+    order as Snake.generate_apple, so a board here plays out exactly like the equivalent Snake.
+    If detect_loops is True, boards that repeat a state without eating are stopped early and fast forwarded
+    to when they would have starved, the same as Snake does.
+
+    Cells are stored flat as y * width + x. Each board keeps:
+        occupancy: (N, width*height) bool grid of body cells
+        body:      (N, width*height) ring buffer of body cells, starting at head_idx for `length` cells
+        apple:     (N,) flat cell of the apple, -1 if there is none
+        alive:     (N,) mask of snakes that are still playing
+        death_cause: (N,) index into DEATH_CAUSES, -1 while alive
+    """
+    def __init__(self, board_size: Tuple[int, int],
+                 start_positions: Sequence[Tuple[int, int]],
+                 starting_directions: Sequence[str],
+                 apple_seeds: Sequence[int],
+                 initial_velocities: Optional[Sequence[Optional[str]]] = None,
+                 vision_type: Tuple[Slope, ...] = VISION_8,
+                 apple_and_self_vision: Optional[str] = 'binary',
+                 starvation_limit: Optional[int] = 100,
+                 detect_loops: Optional[bool] = False):
+        self.board_size = tuple(board_size)
+        self.width, self.height = self.board_size
+        self.num_cells = self.width * self.height
+        self.num_boards = len(start_positions)
+        self.vision_type = vision_type
+        self.apple_and_self_vision = apple_and_self_vision.lower()
+        self.starvation_limit = starvation_limit
+        self.detect_loops = detect_loops
+        self.num_inputs = len(self.vision_type) * 3 + 4 + 4
+
+        N = self.num_boards
+        self.occupancy = np.zeros((N, self.num_cells), dtype=bool)
+        self.body = np.zeros((N, self.num_cells), dtype=np.int64)
+        self.head_idx = np.zeros(N, dtype=np.int64)
+        self.length = np.full(N, 3, dtype=np.int64)
+        self.apple = np.full(N, -1, dtype=np.int64)
+        self.alive = np.ones(N, dtype=bool)
+        self.death_cause = np.full(N, -1, dtype=np.int8)
+        self.direction = np.zeros(N, dtype=np.int64)
+        self.tail_direction = np.zeros(N, dtype=np.int64)
+        self.score = np.zeros(N, dtype=np.int64)
+        self.frames = np.zeros(N, dtype=np.int64)
+        self.frames_since_last_apple = np.zeros(N, dtype=np.int64)
+
+        # Cells in the order Snake.generate_apple lists possibilities, i.e. divmod(i, height) -> (x, y)
+        i = np.arange(self.num_cells)
+        x, y = np.divmod(i, self.height)
+        self._apple_order = y * self.width + x
+
+        self.rand_apple = [random.Random(seed) for seed in apple_seeds]
+
+        if initial_velocities is None:
+            initial_velocities = [None] * N
+
+        for n in range(N):
+            start_x, start_y = start_positions[n]
+            starting_direction = starting_directions[n][0].lower()
+            code = POSSIBLE_DIRECTIONS.index(starting_direction)
+            # The body trails behind the head, opposite to the way it faces
+            for k in range(3):
+                cell = (start_y - k * _DY[code]) * self.width + (start_x - k * _DX[code])
+                self.body[n, k] = cell
+                self.occupancy[n, cell] = True
+
+            if initial_velocities[n]:
+                code = POSSIBLE_DIRECTIONS.index(initial_velocities[n][0].lower())
+            self.direction[n] = code
+            self.tail_direction[n] = code
+            self._generate_apple(n)
+
+        if self.detect_loops:
+            self._init_loop_detection()
+
+    @classmethod
+    def from_snakes(cls, snakes: Sequence['Snake'], starvation_limit: Optional[int] = None,
+                    detect_loops: Optional[bool] = False) -> 'BatchSnakeEnv':
+        """
+        Create an environment holding the starting state of each snake.
+        starvation_limit defaults to the first snake's.
+        """
+        s = snakes[0]
+        if starvation_limit is None:
+            starvation_limit = s.starvation_limit
+        return cls(s.board_size,
+                   [(snake.start_pos.x, snake.start_pos.y) for snake in snakes],
+                   [snake.starting_direction for snake in snakes],
+                   [snake.apple_seed for snake in snakes],
+                   initial_velocities=[snake.initial_velocity for snake in snakes],
+                   vision_type=s._vision_type,
+                   apple_and_self_vision=s.apple_and_self_vision,
+                   starvation_limit=starvation_limit,
+                   detect_loops=detect_loops)
+
+    @classmethod
+    def from_genomes(cls, genomes: Sequence['SnakeGenome'], board_size: Tuple[int, int],
+                     vision_type: Tuple[Slope, ...] = VISION_8,
+                     apple_and_self_vision: Optional[str] = 'binary',
+                     starvation_limit: Optional[int] = 100,
+                     detect_loops: Optional[bool] = False) -> 'BatchSnakeEnv':
+        """
+        Create an environment for genomes without building a Snake for each one.
+        """
+        return cls(board_size,
+                   [(genome.start_pos.x, genome.start_pos.y) for genome in genomes],
+                   [genome.starting_direction for genome in genomes],
+                   [genome.apple_seed for genome in genomes],
+                   vision_type=vision_type,
+                   apple_and_self_vision=apple_and_self_vision,
+                   starvation_limit=starvation_limit,
+                   detect_loops=detect_loops)
+
+    @property
+    def done(self) -> bool:
+        return not self.alive.any()
+
+    def head_positions(self) -> np.ndarray:
+        return self.body[np.arange(self.num_boards), self.head_idx]
+
+    def snake_cells(self, n: int) -> List[Point]:
+        """
+        Body of board n as a list of Points, head first. Same as list(snake.snake_array).
+        """
+        cells = self.body[n, (self.head_idx[n] + np.arange(self.length[n])) % self.num_cells]
+        return [Point(int(cell % self.width), int(cell // self.width)) for cell in cells]
+
+    def observe(self) -> np.ndarray:
+        """
+        Returns an (N, num_inputs) array of network inputs, laid out the same as Snake.vision_as_array.
+        Rows for dead snakes are zero.
+        """
+        N = self.num_boards
+        inputs = np.zeros((N, self.num_inputs))
+        idx = np.flatnonzero(self.alive)
+        if not idx.size:
+            return inputs
+
+        heads = self.body[idx, self.head_idx[idx]]
+        head_x = heads % self.width
+        head_y = heads // self.width
+        apples = self.apple[idx]
+        max_steps = max(self.width, self.height)
+
+        for v, slope in enumerate(self.vision_type):
+            dist_to_wall = np.zeros(idx.size)
+            dist_to_apple = np.full(idx.size, np.inf)
+            dist_to_self = np.full(idx.size, np.inf)
+            in_wall = np.ones(idx.size, dtype=bool)
+
+            for step in range(1, max_steps + 1):
+                x = head_x + step * slope.run
+                y = head_y + step * slope.rise
+                in_wall &= (x >= 0) & (y >= 0) & (x < self.width) & (y < self.height)
+                if not in_wall.any():
+                    break
+                # Rays that are still on the board on this step
+                rows = np.flatnonzero(in_wall)
+                cells = y[rows] * self.width + x[rows]
+                dist_to_wall[rows] = step
+
+                body_hit = rows[self.occupancy[idx[rows], cells] & (dist_to_self[rows] == np.inf)]
+                dist_to_self[body_hit] = step
+                apple_hit = rows[(cells == apples[rows]) & (dist_to_apple[rows] == np.inf)]
+                dist_to_apple[apple_hit] = step
+
+            # Same as Snake.look_in_direction, the distance to the wall is one past the last tile on the board
+            inputs[idx, v * 3] = 1.0 / (dist_to_wall + 1.0)
+            if self.apple_and_self_vision == 'binary':
+                inputs[idx, v * 3 + 1] = (dist_to_apple != np.inf)
+                inputs[idx, v * 3 + 2] = (dist_to_self != np.inf)
+            elif self.apple_and_self_vision == 'distance':
+                inputs[idx, v * 3 + 1] = 1.0 / dist_to_apple
+                inputs[idx, v * 3 + 2] = 1.0 / dist_to_self
+
+        i = len(self.vision_type) * 3
+        inputs[idx, i + self.direction[idx]] = 1.0
+        inputs[idx, i + 4 + self.tail_direction[idx]] = 1.0
+        return inputs
+
+    def step(self, directions: np.ndarray) -> None:
+        """
+        Advance every live snake one frame.
+        directions: (N,) direction codes (index into POSSIBLE_DIRECTIONS). Entries for dead snakes are ignored.
+        """
+        idx = np.flatnonzero(self.alive)
+        if not idx.size:
+            return
+
+        cap = self.num_cells
+        directions = np.asarray(directions, dtype=np.int64)
+        self.direction[idx] = directions[idx]
+        self.frames[idx] += 1
+
+        heads = self.body[idx, self.head_idx[idx]]
+        next_x = heads % self.width + _DX[self.direction[idx]]
+        next_y = heads // self.width + _DY[self.direction[idx]]
+        in_bounds = (next_x >= 0) & (next_y >= 0) & (next_x < self.width) & (next_y < self.height)
+        next_cell = np.where(in_bounds, next_y * self.width + next_x, 0)
+
+        tail_slot = (self.head_idx[idx] + self.length[idx] - 1) % cap
+        tails = self.body[idx, tail_slot]
+        # Moving into the tail is fine since the tail moves out of the way
+        is_tail = in_bounds & (next_cell == tails)
+        valid = in_bounds & (is_tail | ~self.occupancy[idx, next_cell])
+
+        self.alive[idx[~valid]] = False
+        self.death_cause[idx[~valid]] = np.where(in_bounds[~valid], DEATH_CAUSES.index('self'), DEATH_CAUSES.index('wall'))
+        idx, next_cell, tails, is_tail = idx[valid], next_cell[valid], tails[valid], is_tail[valid]
+        if not idx.size:
+            return
+
+        eats = ~is_tail & (next_cell == self.apple[idx])
+        moves = ~eats
+        if self.detect_loops:
+            self._update_body_hash(idx, heads[valid], next_cell, tails[moves], idx[moves])
+
+        # Normal movement and chasing the tail: drop the tail before placing the head
+        # so that a head landing on the old tail stays occupied
+        self.occupancy[idx[moves], tails[moves]] = False
+        self.occupancy[idx, next_cell] = True
+        self.head_idx[idx] = (self.head_idx[idx] - 1) % cap
+        self.body[idx, self.head_idx[idx]] = next_cell
+        self.length[idx[eats]] += 1
+
+        eaters = idx[eats]
+        self.score[eaters] += 1
+        self.frames_since_last_apple[eaters] = 0
+        for n in eaters:
+            self._generate_apple(n)
+            if self.detect_loops:
+                # States from before can't come back since the snake is longer now
+                self.seen_states[n].clear()
+
+        # Figure out which direction the tail is moving
+        p1 = self.body[idx, (self.head_idx[idx] + self.length[idx] - 1) % cap]
+        p2 = self.body[idx, (self.head_idx[idx] + self.length[idx] - 2) % cap]
+        diff_x = p2 % self.width - p1 % self.width
+        diff_y = p2 // self.width - p1 // self.width
+        tail_direction = self.tail_direction[idx]
+        tail_direction[diff_y < 0] = 0
+        tail_direction[diff_y > 0] = 1
+        tail_direction[diff_x > 0] = 3
+        tail_direction[diff_x < 0] = 2
+        self.tail_direction[idx] = tail_direction
+
+        self.frames_since_last_apple[idx] += 1
+        starved = idx[self.frames_since_last_apple[idx] > self.starvation_limit]
+        self.alive[starved] = False
+        self.death_cause[starved] = DEATH_CAUSES.index('starvation')
+
+        if self.detect_loops:
+            self._check_loops(idx[self.alive[idx]])
+
+    def _init_loop_detection(self) -> None:
+        self._hash_tables = get_loop_hash_tables(self.board_size)
+        N = self.num_boards
+        # Zobrist hash of each body. See misc.LoopHashTables
+        self.body_hash = np.zeros(N, dtype=np.uint64)
+        for n in range(N):
+            cells = self.body[n, :self.length[n]]
+            h = self._hash_tables.head[cells[0]]
+            for k in range(1, len(cells)):
+                h ^= self._hash_tables.link[cells[k] * 4 + self._directions_between(cells[k], cells[k - 1])]
+            self.body_hash[n] = h
+        # States each board has been in since its last apple (or the start), same as Snake._seen_states.
+        # A set per board keeps the check per frame constant no matter how long the starvation limit is
+        self.seen_states = [{state} for state in self._state_hash(np.arange(N)).tolist()]
+
+    def _directions_between(self, from_cells: np.ndarray, to_cells: np.ndarray) -> np.ndarray:
+        # Direction code of the step from each cell to its neighbour
+        diff = to_cells - from_cells
+        return np.where(diff == 1, 3, np.where(diff == -1, 2, np.where(diff > 0, 1, 0)))
+
+    def _update_body_hash(self, idx: np.ndarray, old_heads: np.ndarray, new_heads: np.ndarray,
+                          removed_tails: np.ndarray, tail_idx: np.ndarray) -> None:
+        tables = self._hash_tables
+        self.body_hash[idx] ^= tables.head[old_heads] ^ tables.head[new_heads] ^ \
+                               tables.link[old_heads * 4 + self.direction[idx]]
+        # This is called before the body moves, so the new tail is the second to last cell
+        new_tails = self.body[tail_idx, (self.head_idx[tail_idx] + self.length[tail_idx] - 2) % self.num_cells]
+        self.body_hash[tail_idx] ^= tables.link[removed_tails * 4 + self._directions_between(removed_tails, new_tails)]
+
+    def _state_hash(self, idx: np.ndarray) -> np.ndarray:
+        tables = self._hash_tables
+        apples = np.where(self.apple[idx] < 0, self.num_cells, self.apple[idx])
+        return self.body_hash[idx] ^ tables.apple[apples] ^ tables.direction[self.direction[idx]] ^ \
+               tables.tail_direction[self.tail_direction[idx]]
+
+    def _check_loops(self, idx: np.ndarray) -> None:
+        if not idx.size:
+            return
+        looped = []
+        for n, state in zip(idx.tolist(), self._state_hash(idx).tolist()):
+            seen = self.seen_states[n]
+            if state in seen:
+                looped.append(n)
+            else:
+                seen.add(state)
+
+        # These would repeat the same frames until they starve
+        looped = np.array(looped, dtype=np.int64)
+        self.frames[looped] += self.starvation_limit + 1 - self.frames_since_last_apple[looped]
+        self.frames_since_last_apple[looped] = self.starvation_limit + 1
+        self.alive[looped] = False
+        self.death_cause[looped] = DEATH_CAUSES.index('starvation')
+
+    def _generate_apple(self, n: int) -> None:
+        possibilities = self._apple_order[~self.occupancy[n, self._apple_order]]
+        if possibilities.size:
+            self.apple[n] = self.rand_apple[n].choice(possibilities)
+        else:
+            # I guess you win?
+            self.apple[n] = -1
+
+
+def play_batch(env: BatchSnakeEnv, network: BatchFeedForwardNetwork) -> None:
+    """
+    Run every board in env to completion, with board n driven by network n.
+    """
+    directions = np.zeros(env.num_boards, dtype=np.int64)
+    while not env.done:
+        rows = np.flatnonzero(env.alive)
+        X = env.observe()[rows]
+        out = network.feed_forward(X, rows)
+        directions[rows] = np.argmax(out, axis=1)
+        env.step(directions)
@@ -0,0 +1,257 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import List, Tuple, Optional, Dict, Any, Callable
+import numpy as np
+
+from misc import Point, VISION_TYPES
+from snake import Snake
+from neural_network import FeedForwardNetwork, relu, sigmoid
+from trainer import Trainer
+from compiled_game import CompiledGame, HAVE_NUMBA
+from settings import settings as default_settings
+
+
+# Every benchmark is seeded so each run does exactly the same work
+SEED = 0
+
+
+class Result(object):
+    def __init__(self, value: float, unit: str, higher_is_better: bool):
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'value': self.value, 'unit': self.unit, 'higher_is_better': self.higher_is_better}
+
+
+def _seed() -> None:
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+def _best_of(repeat: int, func: Callable[[], float]) -> float:
+    # Take the fastest run since anything slower is noise from the rest of the machine
+    return min(func() for _ in range(repeat))
+
+
+def bench_game_frames(board_size: Tuple[int, int], num_frames: int) -> Result:
+    """
+    Frames per second of Snake.update + Snake.move, starting a new snake whenever one dies.
+    """
+    _seed()
+    frames = 0
+    elapsed = 0.0
+    while frames < num_frames:
+        # Creating the snake isn't part of the time
+        snake = Snake(board_size, hidden_layer_architecture=[20, 12])
+        start = time.perf_counter()
+        while snake.is_alive:
+            snake.update()
+            snake.move()
+        elapsed += time.perf_counter() - start
+        frames += snake._frames
+    return Result(frames / elapsed, 'frames/s', True)
+
+def bench_compiled_game_frames(board_size: Tuple[int, int], num_frames: int) -> Result:
+    """
+    Frames per second of CompiledGame.play on the same kind of snakes as bench_game_frames.
+    """
+    _seed()
+    game = CompiledGame(board_size, hidden_layer_architecture=[20, 12])
+    snake = Snake(board_size, hidden_layer_architecture=[20, 12])
+    # Compile before timing anything
+    game.play(snake.chromosome, snake.start_pos, snake.apple_seed, snake.starting_direction)
+    frames = 0
+    elapsed = 0.0
+    while frames < num_frames:
+        snake = Snake(board_size, hidden_layer_architecture=[20, 12])
+        start = time.perf_counter()
+        _, game_frames, _ = game.play(snake.chromosome, snake.start_pos, snake.apple_seed, snake.starting_direction)
+        elapsed += time.perf_counter() - start
+        frames += game_frames
+    return Result(frames / elapsed, 'frames/s', True)
+
+def bench_look_in_direction(vision_type: int, num_calls: int) -> Result:
+    """
+    Time per look_in_direction call on a 50x50 board.
+    """
+    _seed()
+    snake = Snake((50, 50), hidden_layer_architecture=[20, 12], vision_type=vision_type)
+    slopes = VISION_TYPES[vision_type]
+    def run() -> float:
+        start = time.perf_counter()
+        for _ in range(num_calls // len(slopes)):
+            for slope in slopes:
+                snake.look_in_direction(slope)
+        return (time.perf_counter() - start) / (num_calls // len(slopes) * len(slopes))
+    return Result(_best_of(3, run) * 1e6, 'us/call', False)
+
+def bench_feed_forward(hidden: List[int], num_calls: int) -> Result:
+    """
+    Latency of a single FeedForwardNetwork.feed_forward with VISION_8 inputs.
+    """
+    _seed()
+    network = FeedForwardNetwork([8 * 3 + 4 + 4] + hidden + [4], relu, sigmoid)
+    X = np.random.uniform(0, 1, size=(8 * 3 + 4 + 4, 1))
+    def run() -> float:
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            network.feed_forward(X)
+        return (time.perf_counter() - start) / num_calls
+    return Result(_best_of(3, run) * 1e6, 'us/call', False)
+
+def bench_generate_apple(length: int, num_calls: int) -> Result:
+    """
+    Time per Snake.generate_apple on a 50x50 board with a snake of the given length.
+    The snake is grown by walking it back and forth across the board and feeding it on every step.
+    """
+    _seed()
+    width, height = 50, 50
+    snake = Snake((width, height), start_pos=Point(2, 0), starting_direction='r', hidden_layer_architecture=[20, 12])
+    while snake.length < length:
+        head = snake.head
+        # Go along the row and drop down a row at the end of it
+        if head.y % 2 == 0:
+            direction = 'r' if head.x < width - 1 else 'd'
+        else:
+            direction = 'l' if head.x > 0 else 'd'
+        dx, dy = {'r': (1, 0), 'l': (-1, 0), 'd': (0, 1)}[direction]
+        snake.direction = direction
+        snake.apple_location = Point(head.x + dx, head.y + dy)
+        snake.move()
+
+    def run() -> float:
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            snake.generate_apple()
+        return (time.perf_counter() - start) / num_calls
+    return Result(_best_of(3, run) * 1e6, 'us/call', False)
+
+def bench_next_generation(num_parents: int) -> Result:
+    """
+    Time for Trainer.next_generation with num_parents parents and 2 * num_parents offspring.
+    Scores and frames are made up so no games need to be played.
+    """
+    settings = dict(default_settings)
+    settings['num_parents'] = num_parents
+    settings['num_offspring'] = 2 * num_parents
+    settings['selection_type'] = 'plus'
+    trainer = Trainer(settings, seed=SEED)
+    rng = np.random.default_rng(SEED)
+
+    def fake_results() -> None:
+        for individual in trainer.population.individuals:
+            individual.score = int(rng.integers(0, 20))
+            individual._frames = int(rng.integers(1, 500))
+
+    # The first generation only has num_parents individuals, so time the ones after it
+    fake_results()
+    trainer.next_generation()
+    individuals = list(trainer.population.individuals)
+
+    def run() -> float:
+        trainer.population.individuals = list(individuals)
+        fake_results()
+        start = time.perf_counter()
+        trainer.next_generation()
+        return time.perf_counter() - start
+    return Result(_best_of(3, run) * 1e3, 'ms/generation', False)
+
+
+def get_benchmarks(quick: Optional[bool] = False) -> Dict[str, Callable[[], Result]]:
+    scale = 10 if quick else 1
+    benchmarks = {
+        'game_frames_10x10': lambda: bench_game_frames((10, 10), 20000 // scale),
+        'game_frames_50x50': lambda: bench_game_frames((50, 50), 20000 // scale),
+    }
+    # Only worth timing when it's actually compiled
+    if HAVE_NUMBA:
+        benchmarks['compiled_game_frames_10x10'] = lambda: bench_compiled_game_frames((10, 10), 200000 // scale)
+        benchmarks['compiled_game_frames_50x50'] = lambda: bench_compiled_game_frames((50, 50), 200000 // scale)
+    for vision_type in (4, 8, 16):
+        benchmarks['look_in_direction_vision{}'.format(vision_type)] = lambda v=vision_type: bench_look_in_direction(v, 20000 // scale)
+    for hidden in ([20, 12], [64, 32], [128, 64, 32]):
+        name = 'feed_forward_' + 'x'.join(str(nodes) for nodes in hidden)
+        benchmarks[name] = lambda h=hidden: bench_feed_forward(h, 20000 // scale)
+    for length in (3, 100, 1000, 2000):
+        benchmarks['generate_apple_length{}'.format(length)] = lambda l=length: bench_generate_apple(l, 5000 // scale)
+    for num_parents in (500, 1000):
+        benchmarks['next_generation_{}'.format(num_parents)] = lambda n=num_parents: bench_next_generation(n)
+    return benchmarks
+
+def run_benchmarks(names: Optional[List[str]] = None, quick: Optional[bool] = False) -> Dict[str, Any]:
+    benchmarks = get_benchmarks(quick)
+    results = {}
+    for name, bench in benchmarks.items():
+        if names and name not in names:
+            continue
+        results[name] = bench().to_dict()
+        print('{:<32} {:>14.3f} {}'.format(name, results[name]['value'], results[name]['unit']))
+        sys.stdout.flush()
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'quick': bool(quick),
+        'results': results
+    }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Compare results against a baseline and return the names of benchmarks that got worse by more than threshold
+    (i.e. 0.1 is 10% slower).
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        base = baseline['results'][name]['value']
+        value = result['value']
+        # How much slower we are, as a fraction of the baseline
+        if result['higher_is_better']:
+            change = (base - value) / base
+        else:
+            change = (value - base) / base
+        status = 'REGRESSION' if change > threshold else 'ok'
+        print('{:<32} {:>14.3f} -> {:>14.3f} {:<14} {:+7.1%} slower  {}'.format(name, base, value, result['unit'], change, status))
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the game, network and GA hot paths.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='JSON results from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='How much slower than the baseline counts as a regression (0.1 is 10%%)')
+    parser.add_argument('--only', type=str, nargs='+', default=None,
+                        help='Only run these benchmarks')
+    parser.add_argument('--quick', action='store_true',
+                        help='Do a tenth of the work. Noisier, so only compare quick runs with quick runs')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only, args.quick)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(results, fp, sort_keys=True, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as fp:
+            baseline = json.load(fp)
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('{} benchmark(s) regressed: {}'.format(len(regressions), ', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,489 @@
+import argparse
+import math
+import time
+from typing import List, Tuple, Optional, Dict, Any
+import numpy as np
+
+from misc import Point, get_starvation_limit, get_starvation_limit_from_settings, get_loop_hash_tables, DEATH_CAUSES
+
+# numba is optional. Without it the kernels below are plain Python, which gives the same results
+# but is far slower than Snake, so HAVE_NUMBA decides whether the trainer uses them at all
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        # Used as @njit(...), so hand back a decorator that leaves the function alone
+        def decorator(func):
+            return func
+        return decorator
+
+
+POSSIBLE_DIRECTIONS = ('u', 'd', 'l', 'r')
+# Same order as neural_network.get_activation_by_name
+ACTIVATIONS = ('relu', 'sigmoid', 'linear', 'leaky_relu', 'tanh')
+
+# Mersenne Twister constants, the same as CPython's _randommodule.c
+_MT_N = 624
+_MT_M = 397
+_MT_MATRIX_A = 0x9908b0df
+_MT_UPPER_MASK = 0x80000000
+_MT_LOWER_MASK = 0x7fffffff
+_MASK_32 = 0xffffffff
+
+
+@njit(cache=True)
+def _mt_seed(key: np.ndarray) -> np.ndarray:
+    """
+    State of random.Random(seed) for an int seed, where key is abs(seed) as 32-bit words, least significant first.
+    Slot _MT_N holds the index of the next word.
+    Everything is kept in int64, which holds every intermediate value without overflowing.
+    """
+    mt = np.empty(_MT_N + 1, np.int64)
+    # init_genrand(19650218)
+    mt[0] = 19650218
+    for i in range(1, _MT_N):
+        mt[i] = (1812433253 * (mt[i - 1] ^ (mt[i - 1] >> 30)) + i) & _MASK_32
+
+    # init_by_array(key)
+    i = 1
+    j = 0
+    for _ in range(max(_MT_N, key.shape[0])):
+        mt[i] = ((mt[i] ^ ((mt[i - 1] ^ (mt[i - 1] >> 30)) * 1664525)) + key[j] + j) & _MASK_32
+        i += 1
+        j += 1
+        if i >= _MT_N:
+            mt[0] = mt[_MT_N - 1]
+            i = 1
+        if j >= key.shape[0]:
+            j = 0
+    for _ in range(_MT_N - 1):
+        mt[i] = ((mt[i] ^ ((mt[i - 1] ^ (mt[i - 1] >> 30)) * 1566083941)) - i) & _MASK_32
+        i += 1
+        if i >= _MT_N:
+            mt[0] = mt[_MT_N - 1]
+            i = 1
+    mt[0] = 0x80000000
+    mt[_MT_N] = _MT_N
+    return mt
+
+@njit(cache=True)
+def _mt_next(mt: np.ndarray) -> int:
+    """
+    Next 32-bit word, i.e. genrand_uint32.
+    """
+    if mt[_MT_N] >= _MT_N:
+        for k in range(_MT_N):
+            y = (mt[k] & _MT_UPPER_MASK) | (mt[(k + 1) % _MT_N] & _MT_LOWER_MASK)
+            mt[k] = mt[(k + _MT_M) % _MT_N] ^ (y >> 1) ^ (_MT_MATRIX_A if y & 1 else 0)
+        mt[_MT_N] = 0
+    y = mt[mt[_MT_N]]
+    mt[_MT_N] += 1
+    y ^= y >> 11
+    y ^= (y << 7) & 0x9d2c5680
+    y ^= (y << 15) & 0xefc60000
+    y ^= y >> 18
+    return y
+
+@njit(cache=True)
+def _mt_randbelow(mt: np.ndarray, n: int) -> int:
+    """
+    random.Random._randbelow(n), which is what random.Random.choice uses. n has to fit in 32 bits.
+    """
+    k = 0
+    while (n >> k) > 0:
+        k += 1
+    r = _mt_next(mt) >> (32 - k)
+    while r >= n:
+        r = _mt_next(mt) >> (32 - k)
+    return r
+
+
+@njit(cache=True)
+def _fenwick_add(tree: np.ndarray, i: int, delta: int) -> None:
+    size = tree.shape[0] - 1
+    i += 1
+    while i <= size:
+        tree[i] += delta
+        i += i & -i
+
+@njit(cache=True)
+def _fenwick_kth(tree: np.ndarray, k: int, top_bit: int) -> int:
+    # Position of the (k + 1)-th free cell. Same walk as snake.FreeCells.__getitem__
+    size = tree.shape[0] - 1
+    pos = 0
+    remaining = k + 1
+    bit = top_bit
+    while bit:
+        nxt = pos + bit
+        if nxt <= size and tree[nxt] < remaining:
+            pos = nxt
+            remaining -= tree[nxt]
+        bit >>= 1
+    return pos
+
+@njit(cache=True)
+def _activate(z: float, activation: int) -> float:
+    if activation == 0:
+        return z if z > 0.0 else 0.0
+    elif activation == 1:
+        return 1.0 / (1.0 + math.exp(-z))
+    elif activation == 2:
+        return z
+    elif activation == 3:
+        return z if z > 0.0 else z * 0.01
+    return math.tanh(z)
+
+@njit(cache=True)
+def _direction_to(p1: int, p2: int, width: int) -> int:
+    # Index into POSSIBLE_DIRECTIONS of the step from cell p1 to the neighbouring cell p2
+    x1 = p1 % width
+    x2 = p2 % width
+    if x2 > x1:
+        return 3
+    elif x2 < x1:
+        return 2
+    elif p2 // width > p1 // width:
+        return 1
+    return 0
+
+
+@njit(cache=True)
+def _play(chromosome: np.ndarray, layer_nodes: np.ndarray, hidden_activation: int, output_activation: int,
+          width: int, height: int, rays: np.ndarray, dist_to_wall: np.ndarray, rises: np.ndarray, runs: np.ndarray,
+          binary_vision: bool, starvation_limit: int,
+          start_x: int, start_y: int, direction: int, apple_key: np.ndarray,
+          detect_loops: bool, head_keys: np.ndarray, link_keys: np.ndarray, apple_keys: np.ndarray,
+          direction_keys: np.ndarray, tail_direction_keys: np.ndarray) -> Tuple[int, int, int]:
+    """
+    Play a whole game the way Snake.update and Snake.move do and return (score, frames, death cause index).
+    Cells are y * width + x everywhere except the free cell tree, which uses x * height + y like FreeCells.
+    """
+    num_cells = width * height
+    dx = np.array([0, 0, -1, 1])
+    dy = np.array([-1, 1, 0, 0])
+
+    # Body as a ring buffer of cells. Segment i is body[(head_idx + i) % num_cells]
+    body = np.empty(num_cells, np.int64)
+    occupancy = np.zeros(num_cells, np.bool_)
+    tree = np.empty(num_cells + 1, np.int64)
+    for i in range(num_cells + 1):
+        tree[i] = i & -i
+    top_bit = 1
+    while top_bit * 2 <= num_cells:
+        top_bit *= 2
+    num_free = num_cells
+    mt = _mt_seed(apple_key)
+
+    # Same starting body as Snake.init_snake: the head, then two segments behind it
+    head_idx = 0
+    length = 3
+    for i in range(3):
+        x = start_x - dx[direction] * i
+        y = start_y - dy[direction] * i
+        body[i] = y * width + x
+        occupancy[y * width + x] = True
+        _fenwick_add(tree, x * height + y, -1)
+        num_free -= 1
+    tail_direction = direction
+
+    pos = _fenwick_kth(tree, _mt_randbelow(mt, num_free), top_bit)
+    apple = (pos % height) * width + pos // height
+
+    # Network buffers, big enough for any layer
+    num_layers = layer_nodes.shape[0]
+    max_nodes = 0
+    for l in range(num_layers):
+        max_nodes = max(max_nodes, layer_nodes[l])
+    a_prev = np.zeros(max_nodes)
+    a_next = np.zeros(max_nodes)
+    num_slopes = rises.shape[0]
+
+    body_hash = np.uint64(0)
+    history = np.empty(starvation_limit + 2, np.uint64)
+    num_history = 0
+    if detect_loops:
+        body_hash = head_keys[body[0]]
+        for i in range(1, length):
+            body_hash ^= link_keys[body[i] * 4 + _direction_to(body[i], body[i - 1], width)]
+        history[0] = body_hash ^ apple_keys[apple if apple >= 0 else num_cells] ^ \
+                     direction_keys[direction] ^ tail_direction_keys[tail_direction]
+        num_history = 1
+
+    score = 0
+    frames = 0
+    frames_since_last_apple = 0
+    while True:
+        frames += 1
+
+        # Look
+        head = body[head_idx]
+        head_x = head % width
+        head_y = head // width
+        for s in range(num_slopes):
+            dist_to_self = 0
+            for d in range(rays.shape[2]):
+                cell = rays[s, head, d]
+                if cell < 0:
+                    break
+                if occupancy[cell]:
+                    dist_to_self = d + 1
+                    break
+
+            dist_to_apple = 0
+            if apple >= 0:
+                apple_dx = apple % width - head_x
+                apple_dy = apple // width - head_y
+                if runs[s] != 0:
+                    steps = apple_dx // runs[s]
+                    if apple_dx - steps * runs[s] == 0 and steps > 0 and steps * rises[s] == apple_dy:
+                        dist_to_apple = steps
+                else:
+                    steps = apple_dy // rises[s]
+                    if apple_dx == 0 and apple_dy - steps * rises[s] == 0 and steps > 0:
+                        dist_to_apple = steps
+
+            a_prev[s * 3] = dist_to_wall[s, head]
+            if binary_vision:
+                a_prev[s * 3 + 1] = 1.0 if dist_to_apple else 0.0
+                a_prev[s * 3 + 2] = 1.0 if dist_to_self else 0.0
+            else:
+                a_prev[s * 3 + 1] = 1.0 / dist_to_apple if dist_to_apple else 0.0
+                a_prev[s * 3 + 2] = 1.0 / dist_to_self if dist_to_self else 0.0
+        for i in range(8):
+            a_prev[num_slopes * 3 + i] = 0.0
+        a_prev[num_slopes * 3 + direction] = 1.0
+        a_prev[num_slopes * 3 + 4 + tail_direction] = 1.0
+
+        # Think. Weights are W1, b1, W2, b2, ... with W_l of shape (nodes_l, nodes_l-1)
+        offset = 0
+        for l in range(1, num_layers):
+            n_in = layer_nodes[l - 1]
+            n_out = layer_nodes[l]
+            bias_offset = offset + n_out * n_in
+            activation = output_activation if l == num_layers - 1 else hidden_activation
+            for j in range(n_out):
+                z = 0.0
+                row = offset + j * n_in
+                for k in range(n_in):
+                    z += chromosome[row + k] * a_prev[k]
+                a_next[j] = _activate(z + chromosome[bias_offset + j], activation)
+            offset = bias_offset + n_out
+            for j in range(n_out):
+                a_prev[j] = a_next[j]
+        # np.argmax picks the first of equal outputs
+        direction = 0
+        for j in range(1, 4):
+            if a_prev[j] > a_prev[direction]:
+                direction = j
+
+        # Move
+        next_x = head_x + dx[direction]
+        next_y = head_y + dy[direction]
+        if next_x < 0 or next_y < 0 or next_x >= width or next_y >= height:
+            return score, frames, 0
+        next_cell = next_y * width + next_x
+        tail_cell = body[(head_idx + length - 1) % num_cells]
+        if next_cell != tail_cell and occupancy[next_cell]:
+            return score, frames, 1
+
+        ate = False
+        removed_tail = -1
+        if next_cell == tail_cell:
+            # Moving into the tail. It moves out of the way, so nothing is occupied or freed
+            removed_tail = tail_cell
+            length -= 1
+            head_idx = (head_idx - 1) % num_cells
+            body[head_idx] = next_cell
+            length += 1
+        elif next_cell == apple:
+            ate = True
+            score += 1
+            frames_since_last_apple = 0
+            head_idx = (head_idx - 1) % num_cells
+            body[head_idx] = next_cell
+            length += 1
+            occupancy[next_cell] = True
+            _fenwick_add(tree, next_x * height + next_y, -1)
+            num_free -= 1
+            if num_free > 0:
+                pos = _fenwick_kth(tree, _mt_randbelow(mt, num_free), top_bit)
+                apple = (pos % height) * width + pos // height
+            else:
+                apple = -1
+        else:
+            head_idx = (head_idx - 1) % num_cells
+            body[head_idx] = next_cell
+            length += 1
+            occupancy[next_cell] = True
+            _fenwick_add(tree, next_x * height + next_y, -1)
+            removed_tail = tail_cell
+            length -= 1
+            occupancy[tail_cell] = False
+            _fenwick_add(tree, (tail_cell % width) * height + tail_cell // width, 1)
+
+        new_tail = body[(head_idx + length - 1) % num_cells]
+        tail_direction = _direction_to(new_tail, body[(head_idx + length - 2) % num_cells], width)
+
+        frames_since_last_apple += 1
+        if frames_since_last_apple > starvation_limit:
+            return score, frames, 2
+
+        if detect_loops:
+            body_hash ^= head_keys[head] ^ head_keys[next_cell] ^ link_keys[head * 4 + direction]
+            if removed_tail >= 0:
+                body_hash ^= link_keys[removed_tail * 4 + _direction_to(removed_tail, new_tail, width)]
+            if ate:
+                num_history = 0
+            state = body_hash ^ apple_keys[apple if apple >= 0 else num_cells] ^ \
+                    direction_keys[direction] ^ tail_direction_keys[tail_direction]
+            for i in range(num_history):
+                if history[i] == state:
+                    # Same as Snake: it would loop until it starves, so skip to that
+                    return score, frames + starvation_limit + 1 - frames_since_last_apple, 2
+            history[num_history] = state
+            num_history += 1
+
+
+class CompiledGame(object):
+    """
+    Plays whole games of Snake in a compiled (numba) kernel, working on plain integer arrays instead
+    of Points, deques and dicts of weights. Snake is the reference: for the same chromosome, start_pos,
+    apple_seed and starting_direction the score, frames and death cause are the same, including the apples,
+    since the kernel carries its own copy of random.Random's Mersenne Twister.
+    The exception is the network: its summation order differs from NumPy's, so outputs can differ in the last bit.
+    If two outputs are that close, the snake can pick a different direction and the game goes differently.
+    check_against_snake counts how often that happens.
+
+    Everything that depends only on the settings (ray tables, loop hash keys) is built once here.
+    Without numba this still works, just slowly. Check HAVE_NUMBA before choosing it over Snake.
+    """
+    def __init__(self, board_size: Tuple[int, int],
+                 vision_type: Optional[int] = 8,
+                 hidden_layer_architecture: Optional[List[int]] = [20, 12],
+                 hidden_activation: Optional[str] = 'relu',
+                 output_activation: Optional[str] = 'sigmoid',
+                 apple_and_self_vision: Optional[str] = 'binary',
+                 starvation_limit: Optional[int] = None,
+                 detect_loops: Optional[bool] = False):
+        # Imported here since snake would otherwise be imported by everything that checks HAVE_NUMBA
+        from snake import get_vision_tables
+
+        self.board_size = tuple(board_size)
+        width, height = self.board_size
+        tables = get_vision_tables(self.board_size, vision_type)
+        self.layer_nodes = np.array([len(tables) * 3 + 4 + 4] + list(hidden_layer_architecture) + [4], dtype=np.int64)
+        self.hidden_activation = ACTIVATIONS.index(hidden_activation.lower())
+        self.output_activation = ACTIVATIONS.index(output_activation.lower())
+        self.binary_vision = apple_and_self_vision.lower() == 'binary'
+        self.starvation_limit = get_starvation_limit(self.board_size, starvation_limit)
+        self.detect_loops = detect_loops
+
+        # Rays padded with -1 out to the longest one
+        self.rays = np.full((len(tables), width * height, max(width, height)), -1, dtype=np.int64)
+        self.dist_to_wall = np.empty((len(tables), width * height))
+        for s, table in enumerate(tables):
+            for cell, ray in enumerate(table.rays):
+                self.rays[s, cell, :len(ray)] = ray
+            self.dist_to_wall[s] = table.dist_to_wall
+        self.rises = np.array([table.rise for table in tables], dtype=np.int64)
+        self.runs = np.array([table.run for table in tables], dtype=np.int64)
+
+        loop_tables = get_loop_hash_tables(self.board_size)
+        self._loop_keys = (loop_tables.head, loop_tables.link, loop_tables.apple,
+                           loop_tables.direction, loop_tables.tail_direction)
+
+    @classmethod
+    def from_settings(cls, settings: Dict[str, Any]) -> 'CompiledGame':
+        return cls(tuple(settings['board_size']),
+                   vision_type=settings['vision_type'],
+                   hidden_layer_architecture=settings['hidden_network_architecture'],
+                   hidden_activation=settings['hidden_layer_activation'],
+                   output_activation=settings['output_layer_activation'],
+                   apple_and_self_vision=settings['apple_and_self_vision'],
+                   starvation_limit=get_starvation_limit_from_settings(settings),
+                   detect_loops=settings.get('detect_loops', True))
+
+    def play(self, chromosome: np.ndarray, start_pos: Point, apple_seed: int, starting_direction: str) -> Tuple[int, int, str]:
+        """
+        Play a game to the end and return (score, frames, death_cause).
+        """
+        # random.Random seeds from the absolute value of an int, split into 32-bit words
+        seed = abs(int(apple_seed))
+        key = []
+        while seed:
+            key.append(seed & 0xffffffff)
+            seed >>= 32
+        score, frames, death_cause = _play(np.ascontiguousarray(chromosome, dtype=np.float64), self.layer_nodes,
+                                           self.hidden_activation, self.output_activation,
+                                           self.board_size[0], self.board_size[1],
+                                           self.rays, self.dist_to_wall, self.rises, self.runs,
+                                           self.binary_vision, self.starvation_limit,
+                                           start_pos.x, start_pos.y,
+                                           POSSIBLE_DIRECTIONS.index(starting_direction[0].lower()),
+                                           np.array(key or [0], dtype=np.int64),
+                                           self.detect_loops, *self._loop_keys)
+        return int(score), int(frames), DEATH_CAUSES[death_cause]
+
+
+def check_against_snake(settings: Dict[str, Any], num_games: int, seed: Optional[int] = 0) -> int:
+    """
+    Play num_games random snakes with both Snake and CompiledGame and print any game where they disagree.
+    Returns the number of games that disagreed.
+    """
+    from snake import Snake
+
+    rng = np.random.default_rng(seed)
+    game = CompiledGame.from_settings(settings)
+    mismatches = 0
+    snake_seconds = compiled_seconds = 0.0
+    for i in range(num_games):
+        snake = Snake(tuple(settings['board_size']),
+                      hidden_layer_architecture=settings['hidden_network_architecture'],
+                      hidden_activation=settings['hidden_layer_activation'],
+                      output_activation=settings['output_layer_activation'],
+                      apple_and_self_vision=settings['apple_and_self_vision'],
+                      vision_type=settings['vision_type'],
+                      starvation_limit=get_starvation_limit_from_settings(settings),
+                      detect_loops=settings.get('detect_loops', True),
+                      rng=rng)
+        start = time.perf_counter()
+        result = game.play(snake.chromosome, snake.start_pos, snake.apple_seed, snake.starting_direction)
+        compiled_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        while snake.is_alive:
+            snake.update()
+            snake.move()
+        snake_seconds += time.perf_counter() - start
+
+        expected = (snake.score, snake._frames, snake.death_cause)
+        if result != expected:
+            mismatches += 1
+            print('Game {} differs: Snake {}, compiled {}'.format(i, expected, result))
+
+    print('{}/{} games match. Snake {:.3f}s, compiled {:.3f}s ({})'.format(
+        num_games - mismatches, num_games, snake_seconds, compiled_seconds,
+        'numba' if HAVE_NUMBA else 'numba not installed, running as plain Python'))
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Check the compiled game against Snake.')
+    parser.add_argument('--settings', type=str, default=None,
+                        help='Path to a settings JSON file. Defaults to settings.py')
+    parser.add_argument('--games', type=int, default=200,
+                        help='Number of random snakes to play')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the random snakes')
+    args = parser.parse_args(argv)
+
+    from trainer import load_settings
+    if check_against_snake(load_settings(args.settings), args.games, args.seed):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
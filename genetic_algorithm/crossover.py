@@ -1,5 +1,5 @@
 import numpy as np
-from typing import Tuple
+from typing import Tuple, Optional
 
 def simulated_binary_crossover(parent1: np.ndarray, parent2: np.ndarray, eta: float) -> Tuple[np.ndarray, np.ndarray]:
     """
@@ -56,4 +56,60 @@ def single_point_binary_crossover(parent1: np.ndarray, parent2: np.ndarray, majo
         offspring1[:row+1, col] = parent2[:row+1, col]
         offspring2[:row+1, col] = parent1[:row+1, col]
 
+    return offspring1, offspring2
+
+# Batched variants.
+# These take (num_pairs, num_genes) matrices where row i of parents1 and parents2 is one pair,
+# and produce every offspring at once instead of looping over pairs in Python.
+# They also take an optional rng (np.random.Generator) and fall back to the global np.random state.
+
+def batch_simulated_binary_crossover(parents1: np.ndarray, parents2: np.ndarray, eta: float,
+                                     rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    simulated_binary_crossover for every pair at once.
+    Row i of the returned matrices are the two children of pair i.
+    """
+    if rng is None:
+        rng = np.random
+    # Calculate Gamma (Eq. 9.11)
+    rand = rng.random(parents1.shape)
+    gamma = np.where(rand <= 0.5,
+                     (2 * rand) ** (1.0 / (eta + 1)),                   # First case of equation 9.11
+                     (1.0 / (2.0 * (1.0 - rand))) ** (1.0 / (eta + 1)))  # Second case
+
+    # Calculate Child 1 chromosome (Eq. 9.9)
+    chromosomes1 = 0.5 * ((1 + gamma)*parents1 + (1 - gamma)*parents2)
+    # Calculate Child 2 chromosome (Eq. 9.10)
+    chromosomes2 = 0.5 * ((1 - gamma)*parents1 + (1 + gamma)*parents2)
+
+    return chromosomes1, chromosomes2
+
+def batch_uniform_binary_crossover(parents1: np.ndarray, parents2: np.ndarray,
+                                   rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    uniform_binary_crossover for every pair at once.
+    """
+    if rng is None:
+        rng = np.random
+    mask = rng.uniform(0, 1, size=parents1.shape) > 0.5
+    offspring1 = np.where(mask, parents2, parents1)
+    offspring2 = np.where(mask, parents1, parents2)
+
+    return offspring1, offspring2
+
+def batch_single_point_binary_crossover(parents1: np.ndarray, parents2: np.ndarray,
+                                        rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Single point binary crossover for every pair at once, with a different crossover point for each pair.
+    Genes up to and including the crossover point are swapped, the same as single_point_binary_crossover
+    does for a single row.
+    """
+    if rng is None:
+        rng = np.random
+    num_pairs, num_genes = parents1.shape
+    points = rng.choice(num_genes, size=num_pairs)
+    mask = np.arange(num_genes)[np.newaxis, :] <= points[:, np.newaxis]
+    offspring1 = np.where(mask, parents2, parents1)
+    offspring2 = np.where(mask, parents1, parents2)
+
     return offspring1, offspring2
\ No newline at end of file
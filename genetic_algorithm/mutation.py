@@ -104,4 +104,40 @@ def mmo_mutation(chromosome: np.ndarray, prob_mutation: float) -> None:
     delta[mutation_array] = normal[mutation_array] + cauchy[mutation_array]
 
     # Update individual
-    chromosome[mutation_array] += delta[mutation_array]
\ No newline at end of file
+    chromosome[mutation_array] += delta[mutation_array]
+
+# Batched variants.
+# These take a (num_individuals, num_genes) matrix and mutate every individual in place at once.
+# Only the genes that actually mutate get a random value drawn for them.
+# They also take an optional rng (np.random.Generator) and fall back to the global np.random state.
+
+def batch_gaussian_mutation(chromosomes: np.ndarray, prob_mutation: float,
+                            mu: float = 0.0, sigma: float = 1.0,
+                            scale: Optional[float] = None,
+                            rng: Optional[np.random.Generator] = None) -> None:
+    """
+    gaussian_mutation for every individual at once.
+    Each gene mutates with probability prob_mutation by a value drawn from N(mu, sigma), multiplied by scale if given.
+    """
+    if rng is None:
+        rng = np.random
+    # Determine which genes will be mutated
+    mutation_array = rng.random(chromosomes.shape) < prob_mutation
+    mutation = rng.normal(mu, sigma, size=np.count_nonzero(mutation_array))
+    if scale:
+        mutation *= scale
+
+    # Update
+    chromosomes[mutation_array] += mutation
+
+def batch_random_uniform_mutation(chromosomes: np.ndarray, prob_mutation: float,
+                                  low: float, high: float,
+                                  rng: Optional[np.random.Generator] = None) -> None:
+    """
+    random_uniform_mutation for every individual at once.
+    Each gene is replaced with probability prob_mutation by a value drawn uniformly from [low, high).
+    """
+    if rng is None:
+        rng = np.random
+    mutation_array = rng.random(chromosomes.shape) < prob_mutation
+    chromosomes[mutation_array] = rng.uniform(low, high, size=np.count_nonzero(mutation_array))
\ No newline at end of file
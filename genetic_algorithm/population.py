@@ -17,12 +17,23 @@ class Population(object):
 
     @property
     def num_genes(self) -> int:
-        return self.individuals[0].chromosome.shape[1]
+        return self.individuals[0].chromosome.shape[-1]
 
     @num_genes.setter
     def num_genes(self, val) -> None:
         raise Exception('Cannot set the number of genes. You must change Population.individuals instead')
 
+    @property
+    def chromosomes(self) -> np.ndarray:
+        """
+        Chromosomes of every individual stacked into a (num_individuals, num_genes) matrix.
+        """
+        return np.stack([individual.chromosome for individual in self.individuals])
+
+    @chromosomes.setter
+    def chromosomes(self, val) -> None:
+        raise Exception('Cannot set chromosomes. You must change Population.individuals instead')
+
     @property
     def average_fitness(self) -> float:
         return (sum(individual.fitness for individual in self.individuals) / float(self.num_individuals))
@@ -1,33 +1,57 @@
 import numpy as np
-import random
-from typing import List
+from typing import List, Optional
 from .population import Population
 from .individual import Individual
 
 
+# All of the random selection functions take an optional rng (np.random.Generator) so a run can be
+# reproduced from a seed. If it isn't given they draw from the global np.random state.
+
 def elitism_selection(population: Population, num_individuals: int) -> List[Individual]:
     individuals = sorted(population.individuals, key = lambda individual: individual.fitness, reverse=True)
     return individuals[:num_individuals]
 
-def roulette_wheel_selection(population: Population, num_individuals: int) -> List[Individual]:
-    selection = []
-    wheel = sum(individual.fitness for individual in population.individuals)
-    for _ in range(num_individuals):
-        pick = random.uniform(0, wheel)
-        current = 0
-        for individual in population.individuals:
-            current += individual.fitness
-            if current > pick:
-                selection.append(individual)
-                break
+def _fitness_wheel(population: Population) -> np.ndarray:
+    # Cumulative fitness. Individual i owns the slice of the wheel (wheel[i-1], wheel[i]]
+    return np.cumsum([individual.fitness for individual in population.individuals])
 
-    return selection
+def roulette_wheel_selection(population: Population, num_individuals: int,
+                             rng: Optional[np.random.Generator] = None) -> List[Individual]:
+    """
+    Pick num_individuals with probability proportional to their fitness.
+    The wheel is built once and every pick is found with a binary search.
+    """
+    if rng is None:
+        rng = np.random
+    wheel = _fitness_wheel(population)
+    picks = rng.uniform(0, wheel[-1], size=num_individuals)
+    # Select the first individual whose cumulative fitness is greater than the pick
+    indices = np.minimum(np.searchsorted(wheel, picks, side='right'), len(wheel) - 1)
+    return [population.individuals[i] for i in indices]
 
-def tournament_selection(population: Population, num_individuals: int, tournament_size: int) -> List[Individual]:
-    selection = []
-    for _ in range(num_individuals):
-        tournament = np.random.choice(population.individuals, tournament_size)
-        best_from_tournament = max(tournament, key = lambda individual: individual.fitness)
-        selection.append(best_from_tournament)
+def stochastic_universal_sampling(population: Population, num_individuals: int,
+                                  rng: Optional[np.random.Generator] = None) -> List[Individual]:
+    """
+    Like roulette wheel selection but with num_individuals evenly spaced pointers and a single spin.
+    This keeps the number of times an individual is picked close to what its fitness deserves.
+    """
+    if rng is None:
+        rng = np.random
+    wheel = _fitness_wheel(population)
+    spacing = wheel[-1] / num_individuals
+    pointers = rng.uniform(0, spacing) + spacing * np.arange(num_individuals)
+    indices = np.minimum(np.searchsorted(wheel, pointers, side='right'), len(wheel) - 1)
+    return [population.individuals[i] for i in indices]
 
-    return selection
\ No newline at end of file
+def tournament_selection(population: Population, num_individuals: int, tournament_size: int,
+                         rng: Optional[np.random.Generator] = None) -> List[Individual]:
+    """
+    Run num_individuals tournaments of tournament_size randomly chosen individuals (with replacement)
+    and select the fittest of each.
+    """
+    if rng is None:
+        rng = np.random
+    fitness = np.array([individual.fitness for individual in population.individuals])
+    tournaments = rng.choice(len(fitness), size=(num_individuals, tournament_size))
+    winners = tournaments[np.arange(num_individuals), np.argmax(fitness[tournaments], axis=1)]
+    return [population.individuals[i] for i in winners]
\ No newline at end of file
@@ -0,0 +1,255 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+from typing import List, Tuple, Optional, Dict, Any
+import numpy as np
+
+from misc import Point
+from snake import SnakeGenome
+from trainer import Trainer, load_settings
+
+
+# Migrants are dropped into another island's population as they are, so every island has to
+# build the same network and play the same game. They also keep the fitness they got on their own
+# island, so everything that goes into a fitness has to be the same too
+SHARED_SETTINGS = ('board_size', 'vision_type', 'hidden_network_architecture',
+                   'hidden_layer_activation', 'output_layer_activation', 'apple_and_self_vision',
+                   'starvation_limit', 'scale_starvation_limit', 'detect_loops', 'lifespan',
+                   'num_episodes', 'episode_aggregation')
+
+
+def island_seeds(seed: int, num_islands: int) -> List[int]:
+    """
+    An independent seed for every island, derived from the seed of the whole run.
+    """
+    children = np.random.SeedSequence(seed).spawn(num_islands)
+    return [int.from_bytes(child.generate_state(2, np.uint64).tobytes(), 'little') for child in children]
+
+def check_island_settings(settings_list: List[Dict[str, Any]]) -> None:
+    for i, settings in enumerate(settings_list[1:], 1):
+        for key in SHARED_SETTINGS:
+            if list(np.ravel(settings.get(key))) != list(np.ravel(settings_list[0].get(key))):
+                raise Exception('Island {} has a different "{}" than island 0. Migrants would not fit or their fitness would not compare'.format(i, key))
+
+def check_migration(settings_list: List[Dict[str, Any]], migration_interval: int, num_migrants: int) -> None:
+    """
+    Catch a bad migration_interval or num_migrants here, before they'd blow up inside every island process.
+    """
+    if migration_interval < 1:
+        raise Exception('migration_interval must be at least 1, got {}'.format(migration_interval))
+    for i, settings in enumerate(settings_list):
+        # Islands migrate from the first population (num_parents) and from every generation after it
+        if settings['selection_type'].lower() == 'comma':
+            next_gen_size = settings['num_offspring']
+        else:
+            next_gen_size = settings['num_parents'] + settings['num_offspring']
+        population_size = min(settings['num_parents'], next_gen_size)
+        if not 0 <= num_migrants <= population_size:
+            raise Exception('Island {} can have as few as {} individuals, so it can\'t send {} migrants'.format(
+                i, population_size, num_migrants))
+
+def vary_settings(settings_list: List[Dict[str, Any]], variations: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Copy the settings of every island. Island i gets the (i % len(values))-th value of every varied setting.
+    """
+    varied = []
+    for i, settings in enumerate(settings_list):
+        island_settings = dict(settings)
+        for key, values in variations.items():
+            island_settings[key] = values[i % len(values)]
+        varied.append(island_settings)
+    return varied
+
+
+def emigrants(trainer: Trainer, num_migrants: int) -> List[Dict[str, Any]]:
+    """
+    The best num_migrants of an evaluated population, with everything needed to drop them into another one.
+    """
+    migrants = []
+    for individual in trainer.ranked_individuals()[:num_migrants]:
+        migrants.append({
+            'chromosome': individual.chromosome,
+            'start_pos': (individual.start_pos.x, individual.start_pos.y),
+            'apple_seed': individual.apple_seed,
+            'starting_direction': individual.starting_direction,
+            'score': individual.score,
+            'frames': individual._frames,
+            'death_cause': individual.death_cause,
+            'episode_results': individual.episode_results,
+            'episode_aggregation': individual.episode_aggregation
+        })
+    return migrants
+
+def immigrate(trainer: Trainer, migrants: List[Dict[str, Any]]) -> None:
+    """
+    Replace the worst individuals of an evaluated population with migrants.
+    Migrants keep the results they got on their own island, so they compete in the next selection right away.
+    """
+    if not migrants:
+        return
+    num_kept = max(0, len(trainer.population.individuals) - len(migrants))
+    ranked = trainer.ranked_individuals()[:num_kept]
+    for migrant in migrants:
+        genome = SnakeGenome(trainer.board_size, migrant['chromosome'],
+                             start_pos=Point(*migrant['start_pos']),
+                             apple_seed=migrant['apple_seed'],
+                             starting_direction=migrant['starting_direction'],
+                             lifespan=trainer.settings['lifespan'])
+        genome.score = migrant['score']
+        genome._frames = migrant['frames']
+        genome.death_cause = migrant['death_cause']
+        genome.episode_results = migrant['episode_results']
+        genome.episode_aggregation = migrant['episode_aggregation']
+        genome.calculate_fitness()
+        # In front of the first individual it beats, so the survival order stays the trainer's
+        i = next((i for i, individual in enumerate(ranked) if individual.fitness < genome.fitness), len(ranked))
+        ranked.insert(i, genome)
+    trainer.population.individuals = ranked
+    trainer.set_ranking(ranked)
+
+
+def _run_island(island: int, settings: Dict[str, Any], seed: int, num_generations: int,
+                migration_interval: int, num_migrants: int, batch: bool, checkpoint_dir: Optional[str],
+                inbox: mp.Queue, outbox: mp.Queue, reports: mp.Queue) -> None:
+    trainer = Trainer(settings, batch=batch, seed=seed)
+    if checkpoint_dir:
+        checkpoint = os.path.join(checkpoint_dir, 'island{}.npz'.format(island))
+    while trainer.current_generation < num_generations:
+        trainer.evaluate_population()
+        fittest = trainer.population.fittest_individual
+        reports.put(('generation', island, trainer.current_generation, fittest.fitness, fittest.score,
+                     trainer.population.average_fitness))
+
+        # Every island sends before it waits, so the ring can't deadlock. Since everyone swaps on the
+        # same generations, the run is still reproducible from the seed
+        if inbox is not outbox and (trainer.current_generation + 1) % migration_interval == 0:
+            outbox.put(emigrants(trainer, num_migrants))
+            immigrate(trainer, inbox.get())
+
+        trainer.next_generation()
+        if checkpoint_dir:
+            trainer.save_checkpoint(checkpoint)
+
+    trainer.close()
+    reports.put(('done', island, trainer.best_fitness, trainer.best_score))
+
+
+def run_islands(settings_list: List[Dict[str, Any]], num_generations: int,
+                migration_interval: Optional[int] = 10, num_migrants: Optional[int] = 5,
+                seed: Optional[int] = None, batch: Optional[bool] = False,
+                checkpoint_dir: Optional[str] = None, verbose: Optional[bool] = True) -> List[Dict[str, Any]]:
+    """
+    Evolve one population per settings in its own process (an island model).
+    Every migration_interval generations each island sends copies of its num_migrants best individuals to the
+    next island in a ring, where they replace the worst ones. Islands only talk to each other when they migrate,
+    so there is no per-game IPC like there is with Trainer(num_workers=...).
+    Returns the best fitness and score every island reached.
+    """
+    check_island_settings(settings_list)
+    check_migration(settings_list, migration_interval, num_migrants)
+    num_islands = len(settings_list)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    seeds = island_seeds(seed, num_islands)
+    if checkpoint_dir and not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+
+    inboxes = [mp.Queue() for _ in range(num_islands)]
+    reports = mp.Queue()
+    processes = []
+    for i in range(num_islands):
+        process = mp.Process(target=_run_island,
+                             args=(i, settings_list[i], seeds[i], num_generations, migration_interval, num_migrants,
+                                   batch, checkpoint_dir, inboxes[i], inboxes[(i + 1) % num_islands], reports),
+                             daemon=True)
+        process.start()
+        processes.append(process)
+
+    results: Dict[int, Dict[str, Any]] = {}
+    try:
+        while len(results) < num_islands:
+            try:
+                report = reports.get(timeout=1)
+            except queue.Empty:
+                # If an island died the rest would wait for its migrants forever
+                for i, process in enumerate(processes):
+                    if i not in results and not process.is_alive():
+                        raise Exception('Island {} stopped unexpectedly (exit code {})'.format(i, process.exitcode))
+                continue
+
+            if report[0] == 'generation':
+                _, island, generation, fitness, score, average_fitness = report
+                if verbose:
+                    print('Island {} | Generation {} | Max fitness: {} | Best score: {} | Average fitness: {}'.format(
+                        island, generation, fitness, score, average_fitness))
+                    sys.stdout.flush()
+            elif report[0] == 'done':
+                _, island, best_fitness, best_score = report
+                results[island] = {'seed': seeds[island], 'best_fitness': best_fitness, 'best_score': best_score}
+    finally:
+        for process in processes:
+            if process.is_alive() and len(results) < num_islands:
+                process.terminate()
+            process.join()
+
+    return [results[i] for i in range(num_islands)]
+
+
+def _parse_variation(text: str) -> Tuple[str, List[Any]]:
+    key, _, values = text.partition('=')
+    if not values:
+        raise Exception('Variations look like key=value1,value2 (got "{}")'.format(text))
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(json.loads(value))
+        except ValueError:
+            parsed.append(value)
+    return key, parsed
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Train several populations at once, swapping their best snakes now and then.')
+    parser.add_argument('--settings', type=str, nargs='+', default=None,
+                        help='Settings JSON file for each island. One file is used for every island. Defaults to settings.py')
+    parser.add_argument('--islands', type=int, default=None,
+                        help='Number of islands. Defaults to the number of settings files, or every core')
+    parser.add_argument('--vary', type=str, nargs='+', default=[],
+                        help='Give islands different settings, i.e. mutation_rate=0.05,0.1 SBX_eta=50,100,200. '
+                             'Island i gets the (i %% count)-th value')
+    parser.add_argument('--generations', type=int, required=True,
+                        help='Number of generations every island runs')
+    parser.add_argument('--migration-interval', type=int, default=10,
+                        help='Swap snakes every N generations')
+    parser.add_argument('--migrants', type=int, default=5,
+                        help='Number of snakes each island sends to the next one')
+    parser.add_argument('--batch', action='store_true',
+                        help='Play each population at once on NumPy arrays')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the whole run. Every island gets its own seed from it')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='Folder to save a checkpoint of every island to after each generation')
+    args = parser.parse_args(argv)
+
+    settings_files = args.settings or [None]
+    num_islands = args.islands or (len(settings_files) if len(settings_files) > 1 else os.cpu_count())
+    if len(settings_files) == 1:
+        settings_files = settings_files * num_islands
+    elif len(settings_files) != num_islands:
+        raise Exception('Got {} settings files for {} islands'.format(len(settings_files), num_islands))
+
+    variations = dict(_parse_variation(text) for text in args.vary)
+    settings_list = vary_settings([load_settings(path) for path in settings_files], variations)
+
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    print('Seed:', seed)
+    results = run_islands(settings_list, args.generations, args.migration_interval, args.migrants,
+                          seed=seed, batch=args.batch, checkpoint_dir=args.checkpoint)
+    for i, result in enumerate(results):
+        print('Island {}: best fitness {}, best score {}'.format(i, result['best_fitness'], result['best_score']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
-from typing import List, Tuple, Union, Dict
+import numpy as np
+from typing import List, Tuple, Union, Dict, Optional, Any
 
 
 class Slope(object):
@@ -78,3 +79,76 @@ VISION_8 = tuple([VISION_16[i] for i in range(len(VISION_16)) if i%2==0])
 # Create 4 lines to be able to "see" around
 # Really just VISION_16 but removing anything not divisible by 4
 VISION_4 = tuple([VISION_16[i] for i in range(len(VISION_16)) if i%4==0])
+
+
+# Lookup for settings['vision_type']
+VISION_TYPES = {
+    4: VISION_4,
+    8: VISION_8,
+    16: VISION_16
+}
+
+# Ways a snake can die. batch_env stores these as indices into the tuple
+DEATH_CAUSES = ('wall', 'self', 'starvation')
+
+def get_starvation_limit(board_size: Tuple[int, int], starvation_limit: Optional[int] = None,
+                         scale_with_board: Optional[bool] = False) -> int:
+    """
+    Number of frames a snake can go without an apple before it dies.
+    If starvation_limit isn't given it's the original limit of 100. If scale_with_board is True, the limit is
+    raised to at least the number of cells on the board, i.e. enough frames to visit every tile.
+    """
+    limit = 100 if starvation_limit is None else int(starvation_limit)
+    if scale_with_board:
+        limit = max(limit, board_size[0] * board_size[1])
+    return limit
+
+def get_starvation_limit_from_settings(settings: Dict[str, Any]) -> int:
+    """
+    Starvation limit for a settings dict. Settings saved before the limit was a setting have neither key,
+    so they get 100, which is what those snakes were played with.
+    """
+    return get_starvation_limit(tuple(settings['board_size']), settings.get('starvation_limit', None),
+                                settings.get('scale_starvation_limit', False))
+
+
+class LoopHashTables(object):
+    """
+    Random 64-bit keys used to hash the state of a game (Zobrist hashing), so a snake that is stuck in a loop
+    can be spotted without comparing whole bodies.
+    The state that decides what a snake does next is its body (in order), the apple, its direction and its
+    tail direction. The body is hashed as the head cell plus, for every other segment, its cell and the
+    direction to the segment in front of it. That way a move only changes a few keys:
+        head:  (num_cells,)      key for the head being on a cell
+        link:  (num_cells * 4,)  key for a segment on a cell whose next segment is in direction d
+        apple: (num_cells + 1,)  key for the apple on a cell, the last one is for no apple
+        direction, tail_direction: (4,)
+    Keys are drawn from a fixed seed so hashes are the same in every process.
+    """
+    def __init__(self, board_size: Tuple[int, int]):
+        num_cells = board_size[0] * board_size[1]
+        rng = np.random.default_rng(0x51A4E)
+        self.head = rng.integers(0, 2**63, size=num_cells, dtype=np.uint64)
+        self.link = rng.integers(0, 2**63, size=num_cells * 4, dtype=np.uint64)
+        self.apple = rng.integers(0, 2**63, size=num_cells + 1, dtype=np.uint64)
+        self.direction = rng.integers(0, 2**63, size=4, dtype=np.uint64)
+        self.tail_direction = rng.integers(0, 2**63, size=4, dtype=np.uint64)
+        # Snake hashes one move at a time, which is faster with plain ints
+        self.head_keys = self.head.tolist()
+        self.link_keys = self.link.tolist()
+        self.apple_keys = self.apple.tolist()
+        self.direction_keys = self.direction.tolist()
+        self.tail_direction_keys = self.tail_direction.tolist()
+
+_loop_hash_tables: Dict[Tuple[int, int], LoopHashTables] = {}
+
+def get_loop_hash_tables(board_size: Tuple[int, int]) -> LoopHashTables:
+    board_size = tuple(board_size)
+    if board_size not in _loop_hash_tables:
+        _loop_hash_tables[board_size] = LoopHashTables(board_size)
+    return _loop_hash_tables[board_size]
+
+def get_vision_by_num(num_directions: int) -> Tuple[Slope, ...]:
+    if num_directions not in VISION_TYPES:
+        raise Exception('Vision type "{}" is invalid. Options are {}'.format(num_directions, list(VISION_TYPES.keys())))
+    return VISION_TYPES[num_directions]
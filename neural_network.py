@@ -1,5 +1,5 @@
 import numpy as np
-from typing import List, Callable, NewType, Optional
+from typing import List, Callable, NewType, Optional, Dict, Union, Tuple
 
 
 ActivationFunction = NewType('ActivationFunction', Callable[[np.ndarray], np.ndarray])
@@ -13,12 +13,20 @@ linear = ActivationFunction(lambda X: X)
 
 
 class FeedForwardNetwork(object):
+    """
+    All weights and bias live in one flat, contiguous chromosome laid out as W1, b1, W2, b2, ...
+    params['W' + l] and params['b' + l] are views into it, so changing one changes the other.
+    If a chromosome is given it is used as-is (not copied) and no random weights are drawn.
+    seed can be anything np.random.default_rng takes (an int, SeedSequence or Generator). If it's None
+    the random weights come from the global np.random state.
+    """
     def __init__(self,
                  layer_nodes: List[int],
                  hidden_activation: ActivationFunction,
                  output_activation: ActivationFunction,
                  init_method: Optional[str] = 'uniform',
-                 seed: Optional[int] = None):
+                 seed: Optional[Union[int, np.random.SeedSequence, np.random.Generator]] = None,
+                 chromosome: Optional[np.ndarray] = None):
         self.params = {}
         self.layer_nodes = layer_nodes
         self.hidden_activation = hidden_activation
@@ -26,20 +34,49 @@ class FeedForwardNetwork(object):
         self.inputs = None
         self.out = None
 
-        self.rand = np.random.RandomState(seed)
+        self.rand = np.random.default_rng(seed) if seed is not None else np.random
+
+        self.num_params = get_num_params(self.layer_nodes)
+        initialize = chromosome is None
+        if initialize:
+            chromosome = np.empty(self.num_params)
+        self.set_chromosome(chromosome)
 
         # Initialize weights and bias
-        for l in range(1, len(self.layer_nodes)):
+        if initialize:
             if init_method == 'uniform':
-                self.params['W' + str(l)] = np.random.uniform(-1, 1, size=(self.layer_nodes[l], self.layer_nodes[l-1]))
-                self.params['b' + str(l)] = np.random.uniform(-1, 1, size=(self.layer_nodes[l], 1))
-            
+                chromosome[...] = random_chromosome(self.layer_nodes, self.rand)
             else:
                 raise Exception('Implement more options, bro')
 
+        for l in range(1, len(self.layer_nodes)):
             self.params['A' + str(l)] = None
-        
-        
+
+    def set_chromosome(self, chromosome: np.ndarray) -> None:
+        """
+        Point W_l and b_l at views into a flat chromosome.
+        """
+        if chromosome.shape != (self.num_params,):
+            raise Exception('Chromosome has shape {} but the network needs ({},)'.format(chromosome.shape, self.num_params))
+
+        self.chromosome = chromosome
+        offset = 0
+        for l in range(1, len(self.layer_nodes)):
+            w_shape = (self.layer_nodes[l], self.layer_nodes[l-1])
+            b_shape = (self.layer_nodes[l], 1)
+            self.params['W' + str(l)] = chromosome[offset: offset + w_shape[0] * w_shape[1]].reshape(w_shape)
+            offset += w_shape[0] * w_shape[1]
+            self.params['b' + str(l)] = chromosome[offset: offset + b_shape[0]].reshape(b_shape)
+            offset += b_shape[0]
+
+    def load_params(self, params: Dict[str, np.ndarray]) -> None:
+        """
+        Copy W_l and b_l from a dictionary (i.e. from the .npy files of a saved snake) into the chromosome.
+        """
+        for l in range(1, len(self.layer_nodes)):
+            self.params['W' + str(l)][...] = params['W' + str(l)]
+            self.params['b' + str(l)][...] = params['b' + str(l)]
+
     def feed_forward(self, X: np.ndarray) -> np.ndarray:
         A_prev = X
         L = len(self.layer_nodes) - 1  # len(self.params) // 2
@@ -65,6 +102,141 @@ class FeedForwardNetwork(object):
     def softmax(self, X: np.ndarray) -> np.ndarray:
         return np.exp(X) / np.sum(np.exp(X), axis=0)
 
+class BatchFeedForwardNetwork(object):
+    """
+    Evaluates many networks that share an architecture with one batched matmul per layer.
+    Every W_l and b_l is stacked into (num_networks, nodes_l, nodes_l-1) and (num_networks, nodes_l, 1) arrays.
+    Each network still does its own matrix-vector product, so the output for a network is the same
+    as FeedForwardNetwork.feed_forward on it.
+
+    When only some networks are fed (rows), they're looked up in compacted copies of the stacks that are kept
+    between calls. Networks only ever drop out (their boards die), so instead of gathering the live weights on
+    every call, the compacted stacks keep some dead networks in them and are only gathered again once fewer than
+    compact_fraction of them are still live. Dead networks get zero inputs and their outputs are thrown away.
+    """
+    compact_fraction = 0.75
+
+    def __init__(self,
+                 layer_nodes: List[int],
+                 hidden_activation: ActivationFunction,
+                 output_activation: ActivationFunction,
+                 params: List[Dict[str, np.ndarray]]):
+        self.layer_nodes = layer_nodes
+        self.hidden_activation = hidden_activation
+        self.output_activation = output_activation
+        self.weights: List[np.ndarray] = []
+        self.bias: List[np.ndarray] = []
+        # Networks in the compacted stacks, in order
+        self._compact_rows: Optional[np.ndarray] = None
+        self._compact_weights: List[np.ndarray] = []
+        self._compact_bias: List[np.ndarray] = []
+
+        if params:
+            for l in range(1, len(self.layer_nodes)):
+                self.weights.append(np.stack([p['W' + str(l)] for p in params]))
+                self.bias.append(np.stack([p['b' + str(l)] for p in params]))
+
+    @classmethod
+    def from_networks(cls, networks: List[FeedForwardNetwork]) -> 'BatchFeedForwardNetwork':
+        network = networks[0]
+        return cls(network.layer_nodes, network.hidden_activation, network.output_activation,
+                   [n.params for n in networks])
+
+    @classmethod
+    def from_chromosomes(cls,
+                         layer_nodes: List[int],
+                         hidden_activation: ActivationFunction,
+                         output_activation: ActivationFunction,
+                         chromosomes: np.ndarray) -> 'BatchFeedForwardNetwork':
+        """
+        Build from a (num_networks, num_params) matrix of flat chromosomes without creating any FeedForwardNetwork.
+        """
+        num_networks = chromosomes.shape[0]
+        network = cls(layer_nodes, hidden_activation, output_activation, [])
+        offset = 0
+        for l in range(1, len(layer_nodes)):
+            num_weights = layer_nodes[l] * layer_nodes[l-1]
+            network.weights.append(chromosomes[:, offset: offset + num_weights].reshape(num_networks, layer_nodes[l], layer_nodes[l-1]))
+            offset += num_weights
+            network.bias.append(chromosomes[:, offset: offset + layer_nodes[l]].reshape(num_networks, layer_nodes[l], 1))
+            offset += layer_nodes[l]
+        return network
+
+    def feed_forward(self, X: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        X: (num_rows, num_inputs) inputs, one row per network.
+        rows: which networks the rows of X belong to. If None, X must have a row for every network.
+        Returns (num_rows, num_outputs).
+        """
+        weights, bias, positions = self.weights, self.bias, None
+        if rows is not None:
+            weights, bias, positions = self._compacted(rows)
+            if positions is not None:
+                padded = np.zeros((weights[0].shape[0], X.shape[1]), dtype=X.dtype)
+                padded[positions] = X
+                X = padded
+
+        A_prev = X[:, :, np.newaxis]
+        L = len(weights)
+
+        for l in range(L):
+            Z = np.matmul(weights[l], A_prev) + bias[l]
+            if l < L - 1:
+                A_prev = self.hidden_activation(Z)
+            else:
+                A_prev = self.output_activation(Z)
+
+        out = A_prev[:, :, 0]
+        return out[positions] if positions is not None else out
+
+    def _compacted(self, rows: np.ndarray) -> Tuple[List[np.ndarray], List[np.ndarray], Optional[np.ndarray]]:
+        """
+        Compacted weight and bias stacks holding every network in rows, and where each of rows is in them
+        (None if the stacks hold exactly rows).
+        """
+        rows = np.asarray(rows)
+        if self._compact_rows is None:
+            # Views of the full stacks, so nothing is copied until networks drop out
+            self._compact_rows = np.arange(self.weights[0].shape[0])
+            self._compact_weights, self._compact_bias = self.weights, self.bias
+
+        compact_rows = self._compact_rows
+        positions = np.searchsorted(compact_rows, rows)
+        if len(rows) and (positions[-1] >= len(compact_rows) or not np.array_equal(compact_rows[positions], rows)):
+            if len(compact_rows) == self.weights[0].shape[0]:
+                raise Exception('rows must be sorted network indices')
+            # A network came back (rows aren't a subset of the last ones), so start over from the full stacks
+            self._compact_rows = None
+            return self._compacted(rows)
+
+        if len(rows) == len(compact_rows):
+            return self._compact_weights, self._compact_bias, None
+        if len(rows) < self.compact_fraction * len(compact_rows):
+            self._compact_weights = [W[positions] for W in self._compact_weights]
+            self._compact_bias = [b[positions] for b in self._compact_bias]
+            self._compact_rows = rows.copy()
+            return self._compact_weights, self._compact_bias, None
+        return self._compact_weights, self._compact_bias, positions
+
+def get_num_params(layer_nodes: List[int]) -> int:
+    """
+    Number of weights and bias in a network, i.e. the length of its chromosome.
+    """
+    return sum(layer_nodes[l] * layer_nodes[l-1] + layer_nodes[l] for l in range(1, len(layer_nodes)))
+
+def random_chromosome(layer_nodes: List[int], rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Random uniform [-1, 1) weights and bias as a flat chromosome (W1, b1, W2, b2, ...).
+    Draws from rng if it's given, otherwise from the global np.random state.
+    """
+    if rng is None:
+        rng = np.random
+    params = []
+    for l in range(1, len(layer_nodes)):
+        params.append(rng.uniform(-1, 1, size=layer_nodes[l] * layer_nodes[l-1]))
+        params.append(rng.uniform(-1, 1, size=layer_nodes[l]))
+    return np.concatenate(params)
+
 def get_activation_by_name(name: str) -> ActivationFunction:
     activations = [('relu', relu),
                    ('sigmoid', sigmoid),
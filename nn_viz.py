@@ -34,12 +34,20 @@ class NeuralNetworkViz(QtWidgets.QWidget):
         painter.setRenderHints(QtGui.QPainter.HighQualityAntialiasing)
         painter.setRenderHint(QtGui.QPainter.TextAntialiasing)
         painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
-        vertical_space = 8
-        radius = 8
         height = self.frameGeometry().height()
         width = self.frameGeometry().width()
         layer_nodes = self.snake.network.layer_nodes
 
+        # The input layer grows with the vision type (16 directions has 56 inputs),
+        # so shrink the nodes if the largest layer won't fit at the default size
+        vertical_space = 8
+        radius = 8
+        num_neurons_in_largest_layer = max(layer_nodes)
+        max_node_height = height / float(num_neurons_in_largest_layer)
+        if 2*radius + vertical_space > max_node_height:
+            radius = max_node_height / 3.0
+            vertical_space = max_node_height / 3.0
+
         default_offset = 30
         h_offset = default_offset
         inputs = self.snake.vision_as_array
@@ -80,13 +88,13 @@ class NeuralNetworkViz(QtWidgets.QWidget):
                 # Output layer
                 elif layer == len(layer_nodes) - 1:
                     text = ('U', 'D', 'L', 'R')[node]
-                    painter.drawText(h_offset + 30, node * (radius*2 + vertical_space) + v_offset + 1.5*radius, text)
+                    painter.drawText(QtCore.QPointF(h_offset + 30, node * (radius*2 + vertical_space) + v_offset + 1.5*radius), text)
                     if node == max_out:
                         painter.setBrush(QtGui.QBrush(Qt.green))
                     else:
                         painter.setBrush(QtGui.QBrush(Qt.white))
 
-                painter.drawEllipse(x_loc, y_loc, radius*2, radius*2)
+                painter.drawEllipse(QtCore.QRectF(x_loc, y_loc, radius*2, radius*2))
             h_offset += 150
 
         # Reset horizontal offset for the weights
@@ -112,4 +120,4 @@ class NeuralNetworkViz(QtWidgets.QWidget):
                     start = self.neuron_locations[(l-1, prev_node)]
                     end = self.neuron_locations[(l, curr_node)]
                     # Offset start[0] by diameter of circle so that the line starts on the right of the circle
-                    painter.drawLine(start[0] + radius*2, start[1], end[0], end[1])
\ No newline at end of file
+                    painter.drawLine(QtCore.QLineF(start[0] + radius*2, start[1], end[0], end[1]))
\ No newline at end of file
@@ -0,0 +1,146 @@
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import List, Tuple, Optional, Dict, Any, Callable, Iterator
+
+from snake import Snake
+from neural_network import FeedForwardNetwork, BatchFeedForwardNetwork
+from batch_env import BatchSnakeEnv
+from genetic_algorithm.population import Population
+
+
+class Profiler(object):
+    """
+    Opt-in timing of the hot paths of training.
+
+    Nothing is instrumented until enable() is called. It then swaps each method in targets() for a
+    wrapper that adds to a timer, and disable() puts the original methods back, so there is no
+    overhead at all while profiling is off.
+    Timers are inclusive: Snake.move includes the time spent in Snake.generate_apple.
+
+    The Trainer methods are only timed if trainer_class is given. It's passed in rather than imported
+    since trainer is usually __main__.
+    Only this process is instrumented, so with a process pool the per-snake timers stay empty and
+    only the Trainer ones (evaluation, selection, crossover, mutation) are recorded. The same goes for the
+    compiled game, which never calls Snake or FeedForwardNetwork.
+    Frame, apple and game counts come from the population itself, so they work in every mode.
+    Work that isn't part of training (like recording a replay) can be left out of the timers with paused().
+    """
+    def __init__(self, path: Optional[str] = None, trainer_class: Optional[type] = None):
+        self.path = path
+        self.trainer_class = trainer_class
+        self.enabled = False
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, Any] = {}
+        self._originals: List[Tuple[type, str, Callable]] = []
+        self._generation_start = None
+        # Shared with the wrappers, so pausing doesn't mean swapping every method back
+        self._paused = [False]
+
+    def targets(self) -> List[Tuple[type, str]]:
+        targets = [
+            (Snake, 'look'),
+            (Snake, 'move'),
+            (Snake, 'generate_apple'),
+            (FeedForwardNetwork, 'feed_forward'),
+            (BatchSnakeEnv, 'observe'),
+            (BatchSnakeEnv, 'step'),
+            (BatchSnakeEnv, '_generate_apple'),
+            (BatchFeedForwardNetwork, 'feed_forward'),
+        ]
+        if self.trainer_class:
+            targets.extend((self.trainer_class, name) for name in ('evaluate_population', '_select_parents', '_crossover', '_mutation'))
+        return targets
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        for cls, name in self.targets():
+            original = cls.__dict__[name]
+            self._originals.append((cls, name, original))
+            setattr(cls, name, self._wrap(cls.__name__ + '.' + name, original))
+        self.enabled = True
+        self._generation_start = time.perf_counter()
+
+    def disable(self) -> None:
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        self.enabled = False
+
+    def _wrap(self, timer: str, func: Callable) -> Callable:
+        seconds = self.seconds
+        calls = self.calls
+        paused = self._paused
+        seconds[timer] = 0.0
+        calls[timer] = 0
+        perf_counter = time.perf_counter
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if paused[0]:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[timer] += perf_counter() - start
+                calls[timer] += 1
+        return wrapper
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """
+        Don't time anything inside the with block.
+        """
+        was_paused = self._paused[0]
+        self._paused[0] = True
+        try:
+            yield
+        finally:
+            self._paused[0] = was_paused
+
+    def count_population(self, population: Population) -> None:
+        """
+        Count what the generation simulated. Call this once the population has been evaluated.
+        """
+        individuals = population.individuals
+        evaluation_seconds = self.seconds.get('Trainer.evaluate_population', 0.0)
+        # Extra episodes count too, since they were simulated just the same
+        episodes = [result for individual in individuals for result in (getattr(individual, 'episode_results', None) or ())]
+        num_games = len(individuals) + len(episodes)
+        self.counters = {
+            'snakes': len(individuals),
+            'games': num_games,
+            'frames': sum(individual._frames for individual in individuals) + sum(frames for _, frames in episodes),
+            # Every game starts with an apple and gets a new one for each apple it eats
+            'apples_spawned': sum(individual.score for individual in individuals) + sum(score for score, _ in episodes) + num_games,
+            'games_per_sec': num_games / evaluation_seconds if evaluation_seconds else None
+        }
+
+    def end_generation(self, generation: int) -> Dict[str, Any]:
+        """
+        Collect the timers and counters of a generation, write them to path as one JSON line
+        (if there is a path) and reset everything for the next generation.
+        """
+        now = time.perf_counter()
+        record = {
+            'generation': generation,
+            'seconds': now - self._generation_start if self._generation_start is not None else None,
+            'timers': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]}
+                       for name in self.seconds if self.calls[name]},
+            'counters': self.counters
+        }
+
+        if self.path:
+            with open(self.path, 'a', encoding='utf-8') as fp:
+                fp.write(json.dumps(record) + '\n')
+
+        for name in self.seconds:
+            self.seconds[name] = 0.0
+            self.calls[name] = 0
+        self.counters = {}
+        self._generation_start = now
+        return record
@@ -0,0 +1,280 @@
+import argparse
+import json
+from collections import deque
+from typing import List, Tuple, Optional, Dict, Any, Deque
+import numpy as np
+
+from misc import Point
+from snake import Snake, load_snake
+
+
+POSSIBLE_DIRECTIONS = ('u', 'd', 'l', 'r')
+_STEP = {'u': (0, -1), 'd': (0, 1), 'l': (-1, 0), 'r': (1, 0)}
+
+
+class ReplayState(object):
+    """
+    What the board looks like on one frame of a replay.
+    snake_array and apple_location are the same as on a Snake so it can be drawn the same way.
+    """
+    def __init__(self, frame: int, snake_array: Deque[Point], apple_location: Optional[Point],
+                 direction: str, tail_direction: str, score: int, is_alive: bool):
+        self.frame = frame
+        self.snake_array = snake_array
+        self.apple_location = apple_location
+        self.direction = direction
+        self.tail_direction = tail_direction
+        self.score = score
+        self.is_alive = is_alive
+
+
+class Replay(object):
+    """
+    Everything needed to redraw a game without the network.
+        moves:     direction picked on each frame, packed as 2-bit codes (4 frames per byte)
+        apples:    (score + 1, 2) position of every apple in the order they appeared
+        keyframes: full board state every keyframe_interval frames, so any frame can be rebuilt
+                   by stepping forward from the keyframe before it
+    """
+    def __init__(self, board_size: Tuple[int, int],
+                 start_pos: Point,
+                 starting_direction: str,
+                 initial_velocity: Optional[str],
+                 apple_seed: int,
+                 moves: np.ndarray,
+                 apples: np.ndarray,
+                 keyframe_interval: int,
+                 keyframe_bodies: np.ndarray,
+                 keyframe_offsets: np.ndarray,
+                 keyframe_state: np.ndarray,
+                 score: int,
+                 frames: int):
+        self.board_size = tuple(board_size)
+        self.start_pos = start_pos
+        self.starting_direction = starting_direction
+        self.initial_velocity = initial_velocity
+        self.apple_seed = apple_seed
+        self.moves = moves
+        self.apples = apples
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_bodies = keyframe_bodies
+        self.keyframe_offsets = keyframe_offsets
+        self.keyframe_state = keyframe_state
+        self.score = score
+        self.frames = frames
+
+    def directions(self) -> np.ndarray:
+        """
+        Unpack the moves into one direction code (index into POSSIBLE_DIRECTIONS) per frame.
+        """
+        return unpack_moves(self.moves, self.frames)
+
+    def save(self, path: str) -> None:
+        meta = {
+            'board_size': self.board_size,
+            'start_pos': self.start_pos.to_dict(),
+            'starting_direction': self.starting_direction,
+            'initial_velocity': self.initial_velocity,
+            'apple_seed': self.apple_seed,
+            'keyframe_interval': self.keyframe_interval,
+            'score': self.score,
+            'frames': self.frames
+        }
+        # Write to a file object so np.savez doesn't add .npz to the name
+        with open(path, 'wb') as fp:
+            np.savez_compressed(fp,
+                                meta=np.array(json.dumps(meta)),
+                                moves=self.moves,
+                                apples=self.apples,
+                                keyframe_bodies=self.keyframe_bodies,
+                                keyframe_offsets=self.keyframe_offsets,
+                                keyframe_state=self.keyframe_state)
+
+    @classmethod
+    def load(cls, path: str) -> 'Replay':
+        with np.load(path) as replay:
+            meta = json.loads(str(replay['meta']))
+            return cls(meta['board_size'],
+                       Point.from_dict(meta['start_pos']),
+                       meta['starting_direction'],
+                       meta['initial_velocity'],
+                       meta['apple_seed'],
+                       replay['moves'],
+                       replay['apples'],
+                       meta['keyframe_interval'],
+                       replay['keyframe_bodies'],
+                       replay['keyframe_offsets'],
+                       replay['keyframe_state'],
+                       meta['score'],
+                       meta['frames'])
+
+
+def pack_moves(directions: np.ndarray) -> np.ndarray:
+    """
+    Pack direction codes (0-3) four to a byte. The first frame is in the lowest 2 bits.
+    """
+    codes = np.zeros(-(-len(directions) // 4) * 4, dtype=np.uint8)
+    codes[:len(directions)] = directions
+    codes = codes.reshape(-1, 4)
+    return codes[:, 0] | (codes[:, 1] << 2) | (codes[:, 2] << 4) | (codes[:, 3] << 6)
+
+def unpack_moves(moves: np.ndarray, num_frames: int) -> np.ndarray:
+    codes = (moves[:, np.newaxis] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+    return codes.ravel()[:num_frames]
+
+def record_replay(snake: Snake, keyframe_interval: Optional[int] = 100) -> Replay:
+    """
+    Play a fresh snake until it dies, the same way Trainer.play does, and record the game.
+    """
+    directions: List[int] = []
+    apples: List[Tuple[int, int]] = [(snake.apple_location.x, snake.apple_location.y)]
+    keyframe_bodies: List[Tuple[int, int]] = []
+    keyframe_offsets: List[int] = [0]
+    keyframe_state: List[Tuple[int, int, int]] = []
+
+    def add_keyframe() -> None:
+        keyframe_bodies.extend((point.x, point.y) for point in snake.snake_array)
+        keyframe_offsets.append(len(keyframe_bodies))
+        keyframe_state.append((POSSIBLE_DIRECTIONS.index(snake.direction),
+                               POSSIBLE_DIRECTIONS.index(snake.tail_direction),
+                               snake.score))
+
+    add_keyframe()
+    while snake.is_alive:
+        snake.update()
+        score = snake.score
+        snake.move()
+        directions.append(POSSIBLE_DIRECTIONS.index(snake.direction))
+        if snake.score > score:
+            apples.append((snake.apple_location.x, snake.apple_location.y))
+        if snake._frames % keyframe_interval == 0:
+            add_keyframe()
+
+    return Replay(snake.board_size, snake.start_pos, snake.starting_direction, snake.initial_velocity, snake.apple_seed,
+                  pack_moves(np.array(directions, dtype=np.uint8)),
+                  np.array(apples, dtype=np.int16).reshape(-1, 2),
+                  keyframe_interval,
+                  np.array(keyframe_bodies, dtype=np.int16).reshape(-1, 2),
+                  np.array(keyframe_offsets, dtype=np.int64),
+                  np.array(keyframe_state, dtype=np.int16).reshape(-1, 3),
+                  snake.score, snake._frames)
+
+
+class ReplayPlayer(object):
+    """
+    Rebuilds any frame of a Replay. Jumps to the keyframe at or before the frame and applies the recorded moves
+    from there, so the network is never run and a game is never simulated from the start.
+    """
+    def __init__(self, replay: Replay):
+        self.replay = replay
+        self.board_size = replay.board_size
+        self._directions = replay.directions()
+
+    @property
+    def num_frames(self) -> int:
+        return self.replay.frames
+
+    def state_at(self, frame: int) -> ReplayState:
+        if frame < 0 or frame > self.replay.frames:
+            raise Exception('Frame {} is outside of the replay (0 - {})'.format(frame, self.replay.frames))
+
+        k = frame // self.replay.keyframe_interval
+        start, end = self.replay.keyframe_offsets[k], self.replay.keyframe_offsets[k + 1]
+        snake_array = deque(Point(int(x), int(y)) for x, y in self.replay.keyframe_bodies[start:end])
+        direction, tail_direction, score = (int(v) for v in self.replay.keyframe_state[k])
+        direction, tail_direction = POSSIBLE_DIRECTIONS[direction], POSSIBLE_DIRECTIONS[tail_direction]
+        body = set(snake_array)
+
+        for f in range(k * self.replay.keyframe_interval, frame):
+            direction = POSSIBLE_DIRECTIONS[self._directions[f]]
+            head = snake_array[0]
+            dx, dy = _STEP[direction]
+            next_pos = Point(head.x + dx, head.y + dy)
+            apple = self._apple(score)
+
+            # Same rules as Snake.move
+            if not self._is_valid(next_pos, snake_array, body):
+                continue
+            if next_pos == snake_array[-1]:
+                snake_array.pop()
+                snake_array.appendleft(next_pos)
+            elif next_pos == apple:
+                score += 1
+                snake_array.appendleft(next_pos)
+                body.add(next_pos)
+            else:
+                snake_array.appendleft(next_pos)
+                body.add(next_pos)
+                body.discard(snake_array.pop())
+
+            diff = snake_array[-2] - snake_array[-1]
+            if diff.x < 0:
+                tail_direction = 'l'
+            elif diff.x > 0:
+                tail_direction = 'r'
+            elif diff.y > 0:
+                tail_direction = 'd'
+            elif diff.y < 0:
+                tail_direction = 'u'
+
+        return ReplayState(frame, snake_array, self._apple(score), direction, tail_direction, score,
+                           frame < self.replay.frames)
+
+    def _apple(self, score: int) -> Point:
+        # If the board filled up there is no new apple, so the last one stays
+        x, y = self.replay.apples[min(score, len(self.replay.apples) - 1)]
+        return Point(int(x), int(y))
+
+    def _is_valid(self, position: Point, snake_array: Deque[Point], body: set) -> bool:
+        if not (0 <= position.x < self.board_size[0] and 0 <= position.y < self.board_size[1]):
+            return False
+        return position == snake_array[-1] or position not in body
+
+
+def render_state(state: ReplayState, board_size: Tuple[int, int]) -> str:
+    """
+    Draw a frame as text. 'H' is the head, 'o' the body and 'A' the apple.
+    """
+    board = [['.'] * board_size[0] for _ in range(board_size[1])]
+    if state.apple_location:
+        board[state.apple_location.y][state.apple_location.x] = 'A'
+    for point in state.snake_array:
+        board[point.y][point.x] = 'o'
+    head = state.snake_array[0]
+    board[head.y][head.x] = 'H'
+    return '\n'.join(''.join(row) for row in board)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Record and play back snake replays.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    record = subparsers.add_parser('record', help='Play a saved snake and record its replay')
+    record.add_argument('population', type=str, help='Population folder or snake archive the snake was saved to')
+    record.add_argument('name', type=str, help='Name of the snake. For an archive this can also be a generation')
+    record.add_argument('output', type=str, help='Where to write the replay')
+    record.add_argument('--keyframe-interval', type=int, default=100,
+                        help='Save the full board every N frames')
+
+    show = subparsers.add_parser('show', help='Print a frame of a replay')
+    show.add_argument('replay', type=str, help='Path to a replay')
+    show.add_argument('--frame', type=int, default=None,
+                      help='Frame to show. Defaults to the last one')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        name = int(args.name) if args.name.isdigit() else args.name
+        replay = record_replay(load_snake(args.population, name), args.keyframe_interval)
+        replay.save(args.output)
+        print('Recorded {} frames, score {}'.format(replay.frames, replay.score))
+    elif args.command == 'show':
+        player = ReplayPlayer(Replay.load(args.replay))
+        frame = player.num_frames if args.frame is None else args.frame
+        state = player.state_at(frame)
+        print('Frame {}/{}, score {}'.format(frame, player.num_frames, state.score))
+        print(render_state(state, player.board_size))
+
+
+if __name__ == '__main__':
+    main()
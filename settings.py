@@ -3,6 +3,9 @@ import numpy as np
 
 settings = {
     'board_size':                  (10, 10),
+    # Seed for the whole run. Using the same seed reproduces the same populations,
+    # no matter how the snakes are evaluated. None picks a random seed
+    'seed':                        None,
 
     #### Neural Network related stuff ####
 
@@ -14,9 +17,40 @@ settings = {
     'hidden_network_architecture': [20, 12],   # A list containing number of nodes in each hidden layer
     # Number of directions the snake can "see" in
     'vision_type':                 8,          # Options are [4, 8, 16]
+    # Keep track of where the body is along every line the snake looks along, so looking doesn't have to walk each ray.
+    # Makes moving a bit slower and looking a lot faster on big boards. Worth it from around 30x30 up
+    'incremental_vision':          False,
+
+    #### Game stuff ####
+
+    # Number of frames a snake can go without eating before it starves
+    'starvation_limit':            100,
+    # Raise the starvation limit to at least width * height, so a snake has time to reach any tile on big boards.
+    # Changes the game (and fitness) on boards bigger than 10x10
+    'scale_starvation_limit':      False,
+    # Stop a snake as soon as it repeats itself without eating, since it will just loop until it starves.
+    # Its frames are fast forwarded to when it would have starved, so the fitness is the same either way.
+    'detect_loops':                True,
+    # Play games with the compiled (numba) version of the game when training headless. Same games, just faster,
+    # except that network outputs can differ from NumPy's in the last bit, so a near tie can turn the other way.
+    # That means a seed no longer gives the same run as with --batch (or without numba installed), so it's off by default.
+    # Does nothing if numba isn't installed
+    'use_numba':                   False,
 
     #### GA stuff ####
 
+    ## Fitness ##
+
+    # Number of games each snake plays per generation. Extra games use the same boards for every snake of a generation.
+    # More games give a less noisy fitness, so a lucky apple placement matters less
+    'num_episodes':                1,
+    # How the fitness of every game is combined
+    'episode_aggregation':         'mean',     # Options are ['mean', 'min']
+    # Only play the extra games for snakes close to the cutoff of who survives to the next generation
+    'adaptive_episodes':           False,
+    # How close is close. Fraction of the population on each side of the cutoff. Only used if adaptive_episodes is True
+    'adaptive_episode_band':       0.1,
+
     ## Mutation ##
 
     # Mutation rate is the probability that a given gene in a chromosome will randomly mutate
@@ -38,11 +72,14 @@ settings = {
     'probability_SBX':             0.5,
     # The type of SPBX to consider. If it is 'r' then it flattens a 2D array in row major ordering.
     # If SPBX_type is 'c' then it flattens a 2D array in column major ordering.
+    # Snake chromosomes are already flat (W1, b1, W2, b2, ...), so for them this is a single crossover point either way.
     'SPBX_type':                   'r',        # Options are 'r' for row or 'c' for column
     # Probability that when crossover occurs, it is single point binary crossover
     'probability_SPBX':            0.5,
     # Crossover selection type determines the way in which we select individuals for crossover
-    'crossover_selection_type':    'roulette_wheel',
+    'crossover_selection_type':    'roulette_wheel',  # Options are ['roulette_wheel', 'stochastic_universal_sampling', 'tournament']
+    # Number of individuals in each tournament. Only used if crossover_selection_type == 'tournament'
+    'tournament_size':             3,
 
     ## Selection ##
 
@@ -0,0 +1,90 @@
+from multiprocessing import shared_memory
+from typing import List, Tuple, Optional
+import numpy as np
+
+from misc import DEATH_CAUSES
+from snake import SnakeGenome
+
+
+POSSIBLE_DIRECTIONS = ('u', 'd', 'l', 'r')
+# Columns of SharedPopulation.games and SharedPopulation.results
+GAME_COLUMNS = ('start_x', 'start_y', 'apple_seed', 'starting_direction')
+RESULT_COLUMNS = ('score', 'frames', 'fitness', 'death_cause')
+
+
+class SharedPopulation(object):
+    """
+    Population held in shared memory so worker processes can play it without anything being pickled.
+        chromosomes: (capacity, num_genes) float64, one row per genome
+        games:       (capacity, 4) int64, start_x, start_y, apple_seed and starting_direction (index into POSSIBLE_DIRECTIONS)
+        results:     (capacity, 4) float64, score, frames, fitness and death_cause (index into DEATH_CAUSES, -1 if alive)
+
+    The process that creates it owns the memory and has to unlink() it. Workers attach() by name and only
+    ever see views into the same memory, so a job is just a range of rows no matter how big the network is.
+    """
+    def __init__(self, capacity: int, num_genes: int, names: Optional[Tuple[str, str, str]] = None):
+        self.capacity = capacity
+        self.num_genes = num_genes
+        self._owner = names is None
+        shapes = ((capacity, num_genes), (capacity, len(GAME_COLUMNS)), (capacity, len(RESULT_COLUMNS)))
+        dtypes = (np.float64, np.int64, np.float64)
+
+        self._blocks: List[shared_memory.SharedMemory] = []
+        for i, (shape, dtype) in enumerate(zip(shapes, dtypes)):
+            if self._owner:
+                # SharedMemory can't be empty
+                size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=names[i])
+            self._blocks.append(block)
+        self.chromosomes, self.games, self.results = (np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                                                      for shape, dtype, block in zip(shapes, dtypes, self._blocks))
+
+    @property
+    def names(self) -> Tuple[str, str, str]:
+        return tuple(block.name for block in self._blocks)
+
+    @classmethod
+    def attach(cls, capacity: int, num_genes: int, names: Tuple[str, str, str]) -> 'SharedPopulation':
+        return cls(capacity, num_genes, names)
+
+    def write_genomes(self, genomes: List[SnakeGenome]) -> None:
+        """
+        Copy the chromosomes and game information of genomes into the first len(genomes) rows.
+        """
+        if len(genomes) > self.capacity:
+            raise Exception('{} genomes do not fit in a shared population of {}'.format(len(genomes), self.capacity))
+        for i, genome in enumerate(genomes):
+            self.chromosomes[i] = genome.chromosome
+            self.games[i] = (genome.start_pos.x, genome.start_pos.y, genome.apple_seed,
+                             POSSIBLE_DIRECTIONS.index(genome.starting_direction))
+        self.results[:len(genomes)] = 0
+        # Nobody has died until a worker says so
+        self.results[:len(genomes), RESULT_COLUMNS.index('death_cause')] = -1
+
+    def read_results(self, genomes: List[SnakeGenome]) -> None:
+        """
+        Set score, frames, fitness and death cause of genomes from the first len(genomes) rows of results.
+        """
+        for genome, (score, frames, fitness, death_cause) in zip(genomes, self.results[:len(genomes)].tolist()):
+            genome.score = int(score)
+            genome._frames = int(frames)
+            genome._fitness = fitness
+            genome.death_cause = DEATH_CAUSES[int(death_cause)] if death_cause >= 0 else None
+
+    def close(self) -> None:
+        # Views have to go before the memory they point to can be closed
+        self.chromosomes = self.games = self.results = None
+        for block in self._blocks:
+            block.close()
+
+    def unlink(self) -> None:
+        """
+        Close and free the memory. Only the process that created it should call this.
+        """
+        self.close()
+        if self._owner:
+            for block in self._blocks:
+                block.unlink()
+        self._blocks = []
@@ -1,15 +1,18 @@
 import numpy as np
-from typing import Tuple, Optional, Union, Set, Dict, Any
+from typing import Tuple, Optional, Union, Set, Dict, Any, Deque
 from fractions import Fraction
 import random
 from collections import deque
+from bisect import bisect_left, bisect_right, insort
+from array import array
 import sys
 import os
 import json
+import struct
 
 from misc import *
 from genetic_algorithm.individual import Individual
-from neural_network import FeedForwardNetwork, linear, sigmoid, tanh, relu, leaky_relu, ActivationFunction, get_activation_by_name
+from neural_network import FeedForwardNetwork, linear, sigmoid, tanh, relu, leaky_relu, ActivationFunction, get_activation_by_name, get_num_params
 
 
 
@@ -36,9 +39,239 @@ class DrawableVision(object):
         self.self_location = self_location
 
 
+class RayTable(object):
+    """
+    Precomputed ray casts for one slope on one board size.
+    For every cell (indexed y * width + x), holds the cells a ray from that cell passes through
+    (in order, not including the starting cell), the resulting 1.0 / distance to the wall,
+    and where DrawableVision.wall_location ends up.
+    These never change for a board size, so they're built once and shared by every snake.
+
+    For incremental vision, every cell is also on exactly one line along the slope. line_ids[cell] says which,
+    and line_positions[cell] is how many steps along that line it is, so a ray from a cell is every cell on
+    its line with a larger position. This works since every slope has a rise or run of +-1.
+    """
+    __slots__ = ('rays', 'dist_to_wall', 'wall_locations', 'rise', 'run', 'line_ids', 'line_positions', 'num_lines')
+    def __init__(self, board_size: Tuple[int, int], slope: Slope):
+        width, height = board_size
+        self.rise = slope.rise
+        self.run = slope.run
+        self.rays: List[Tuple[int, ...]] = []
+        self.dist_to_wall: List[float] = []
+        self.wall_locations: List[Optional[Point]] = []
+        self.line_ids: List[int] = []
+        self.line_positions: List[int] = []
+        # Cells with the same cross product with the slope are on the same line
+        lines: Dict[int, int] = {}
+
+        for cell in range(width * height):
+            y, x = divmod(cell, width)
+            ray = []
+            x += slope.run
+            y += slope.rise
+            while x >= 0 and y >= 0 and x < width and y < height:
+                ray.append(y * width + x)
+                x += slope.run
+                y += slope.rise
+
+            self.rays.append(tuple(ray))
+            self.dist_to_wall.append(1.0 / (len(ray) + 1))
+            # Drawn to the first position off the board, or nothing if you're already facing the wall
+            self.wall_locations.append(Point(x, y) if ray else None)
+
+            y, x = divmod(cell, width)
+            self.line_ids.append(lines.setdefault(x * slope.rise - y * slope.run, len(lines)))
+            self.line_positions.append(x * slope.run if abs(slope.run) == 1 else y * slope.rise)
+        self.num_lines = len(lines)
+
+_ray_tables: Dict[Tuple[int, int, int, int], RayTable] = {}
+
+def get_ray_table(board_size: Tuple[int, int], slope: Slope) -> RayTable:
+    key = (board_size[0], board_size[1], slope.rise, slope.run)
+    table = _ray_tables.get(key, None)
+    if table is None:
+        table = RayTable(board_size, slope)
+        _ray_tables[key] = table
+    return table
+
+_vision_tables: Dict[Tuple[int, int, int], Tuple[RayTable, ...]] = {}
+
+def get_vision_tables(board_size: Tuple[int, int], vision_type: int) -> Tuple[RayTable, ...]:
+    """
+    Ray tables for every slope a snake with `vision_type` directions looks along, in the order of its inputs.
+    """
+    key = (board_size[0], board_size[1], vision_type)
+    tables = _vision_tables.get(key, None)
+    if tables is None:
+        tables = tuple(get_ray_table(board_size, slope) for slope in get_vision_by_num(vision_type))
+        _vision_tables[key] = tables
+    return tables
+
+_cell_points: Dict[Tuple[int, int], List[Point]] = {}
+
+def get_cell_points(board_size: Tuple[int, int]) -> List[Point]:
+    """
+    Shared Point for every cell on the board, indexed y * width + x.
+    """
+    key = (board_size[0], board_size[1])
+    points = _cell_points.get(key, None)
+    if points is None:
+        points = [Point(x, y) for y in range(board_size[1]) for x in range(board_size[0])]
+        _cell_points[key] = points
+    return points
+
+class FreeCells(object):
+    """
+    The cells the snake is not on, in the order Snake.generate_apple has always listed them,
+    i.e. index i is the cell divmod(i, height) -> (x, y).
+    Backed by a Fenwick tree, so occupying/releasing a cell and finding the k-th free cell are
+    O(log(width * height)) rather than rebuilding a list of the whole board.
+    It behaves like a sequence of Points, so it can be handed straight to random.Random.choice,
+    which draws exactly the same apples as choosing from the full list.
+    """
+    __slots__ = ('_tree', '_size', '_count', '_height', '_top_bit')
+    def __init__(self, board_size: Tuple[int, int]):
+        self._height = board_size[1]
+        self._size = board_size[0] * board_size[1]
+        self._count = self._size
+        # Every cell starts free, so each node holds the size of the range it covers
+        self._tree = [i & -i for i in range(self._size + 1)]
+        self._top_bit = 1 << (self._size.bit_length() - 1)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, k: int) -> Point:
+        if k < 0 or k >= self._count:
+            raise IndexError('free cell index out of range')
+        tree = self._tree
+        pos = 0
+        remaining = k + 1
+        bit = self._top_bit
+        # Walk down the tree to find the first position with k + 1 free cells at or before it
+        while bit:
+            nxt = pos + bit
+            if nxt <= self._size and tree[nxt] < remaining:
+                pos = nxt
+                remaining -= tree[nxt]
+            bit >>= 1
+        x, y = divmod(pos, self._height)
+        return Point(x, y)
+
+    def occupy(self, position: Point) -> None:
+        self._count -= 1
+        self._add(position.x * self._height + position.y, -1)
+
+    def release(self, position: Point) -> None:
+        self._count += 1
+        self._add(position.x * self._height + position.y, 1)
+
+    def _add(self, i: int, delta: int) -> None:
+        tree = self._tree
+        i += 1
+        while i <= self._size:
+            tree[i] += delta
+            i += i & -i
+
+
+def _randint(low: int, high: int, rng: Optional[np.random.Generator] = None) -> int:
+    # Inclusive of both ends, like random.randint. Falls back to the global random module without an rng
+    if rng is None:
+        return random.randint(low, high)
+    return int(rng.integers(low, high + 1))
+
+def _random_apple_seed(rng: Optional[np.random.Generator] = None) -> int:
+    if rng is None:
+        return np.random.randint(-1000000000, 1000000000)
+    return int(rng.integers(-1000000000, 1000000000))
+
+def snake_fitness(frames: int, score: int) -> float:
+    fitness = (frames) + ((2**score) + (score**2.1)*500) - (((.25 * frames)**1.3) * (score**1.2))
+    # fitness = (frames) + ((2**score) + (score**2.1)*500) - (((.25 * frames)) * (score))
+    # Give positive minimum fitness for roulette wheel selection
+    return max(fitness, .1)
+
+# How the fitness of a genome that played several episodes is combined
+EPISODE_AGGREGATIONS = ('mean', 'min')
+
+
+class SnakeGenome(Individual):
+    """
+    Everything the GA needs to know about a snake without any of the game state.
+    Holds the flat chromosome, the replay information (start_pos, apple_seed, starting_direction)
+    and the results of the last game it played. A Snake is only built from it when it's time to play.
+    Anything that isn't given is drawn from rng, or the global random state if there is no rng.
+
+    score, frames and death_cause are always from the genome's own game (its apple_seed), so it can be replayed.
+    If it also played other episodes, their (score, frames) are in episode_results and the fitness is the
+    episode_aggregation ('mean' or 'min') of the fitness of every game it played.
+    """
+    __slots__ = ('_chromosome', 'start_pos', 'apple_seed', 'starting_direction', 'lifespan',
+                 'score', '_frames', '_fitness', 'death_cause', 'episode_results', 'episode_aggregation')
+
+    def __init__(self, board_size: Tuple[int, int],
+                 chromosome: np.ndarray,
+                 start_pos: Optional[Point] = None,
+                 apple_seed: Optional[int] = None,
+                 starting_direction: Optional[str] = None,
+                 lifespan: Optional[Union[int, float]] = np.inf,
+                 rng: Optional[np.random.Generator] = None
+                 ):
+        self._chromosome = chromosome
+        self.lifespan = lifespan
+        self.score = 0
+        self._frames = 0
+        self._fitness = 0
+        self.death_cause = None
+        self.episode_results: Optional[List[Tuple[int, int]]] = None
+        self.episode_aggregation = 'mean'
+
+        # Same defaults as Snake
+        if not start_pos:
+            x = _randint(2, board_size[0] - 3, rng)
+            y = _randint(2, board_size[1] - 3, rng)
+            start_pos = Point(x, y)
+        self.start_pos = start_pos
+
+        if apple_seed is None:
+            apple_seed = _random_apple_seed(rng)
+        self.apple_seed = apple_seed
+
+        if starting_direction:
+            starting_direction = starting_direction[0].lower()
+        else:
+            starting_direction = ('u', 'd', 'l', 'r')[_randint(0, 3, rng)]
+        self.starting_direction = starting_direction
+
+    @property
+    def fitness(self):
+        return self._fitness
+
+    def calculate_fitness(self):
+        self._fitness = snake_fitness(self._frames, self.score)
+        if self.episode_results:
+            fitnesses = [self._fitness] + [snake_fitness(frames, score) for score, frames in self.episode_results]
+            if self.episode_aggregation == 'min':
+                self._fitness = min(fitnesses)
+            else:
+                self._fitness = sum(fitnesses) / len(fitnesses)
+
+    @property
+    def chromosome(self) -> np.ndarray:
+        return self._chromosome
+
+    def encode_chromosome(self):
+        # Already flat, nothing to do
+        pass
+
+    def decode_chromosome(self):
+        # Decoded by the network when a Snake is built
+        pass
+
+
 class Snake(Individual):
     def __init__(self, board_size: Tuple[int, int],
-                 chromosome: Optional[Dict[str, List[np.ndarray]]] = None,
+                 chromosome: Optional[Union[np.ndarray, Dict[str, np.ndarray]]] = None,
                  start_pos: Optional[Point] = None, 
                  apple_seed: Optional[int] = None,
                  initial_velocity: Optional[str] = None,
@@ -47,8 +280,27 @@ class Snake(Individual):
                  hidden_activation: Optional[ActivationFunction] = 'relu',
                  output_activation: Optional[ActivationFunction] = 'sigmoid',
                  lifespan: Optional[Union[int, float]] = np.inf,
-                 apple_and_self_vision: Optional[str] = 'binary'
+                 apple_and_self_vision: Optional[str] = 'binary',
+                 vision_type: Optional[int] = 8,
+                 rng: Optional[np.random.Generator] = None,
+                 starvation_limit: Optional[int] = None,
+                 detect_loops: Optional[bool] = False,
+                 incremental_vision: Optional[bool] = False
                  ):
+        """
+        Anything random that isn't given (start_pos, apple_seed, starting_direction and the weights
+        if there is no chromosome) is drawn from rng, or the global random state if there is no rng.
+
+        The snake starves if it goes more than starvation_limit frames without an apple (see get_starvation_limit).
+        If detect_loops is True, the snake is stopped as soon as it repeats a state without eating, since it will
+        then loop until it starves. Its frames are fast forwarded to when it would have starved, so score, frames
+        and fitness are the same as if it had played it out.
+
+        If incremental_vision is True, the snake keeps the sorted positions of its body on every line of every
+        slope it looks along (see RayTable). move() only adds the new head and removes the old tail, and look()
+        finds the closest body part on each ray with a bisect instead of walking the ray. Vision is the same
+        either way, this is just faster for long snakes on big boards.
+        """
 
         self.lifespan = lifespan
         self.apple_and_self_vision = apple_and_self_vision.lower()
@@ -56,10 +308,14 @@ class Snake(Individual):
         self._fitness = 0  # Overall fitness
         self._frames = 0  # Number of frames that the snake has been alive
         self._frames_since_last_apple = 0
+        self.death_cause = None  # One of DEATH_CAUSES once the snake dies
         self.possible_directions = ('u', 'd', 'l', 'r')
 
         self.board_size = board_size
         self.hidden_layer_architecture = hidden_layer_architecture
+        self.starvation_limit = get_starvation_limit(self.board_size, starvation_limit)
+        self.detect_loops = detect_loops
+        self.incremental_vision = incremental_vision
 
         
         self.hidden_activation = hidden_activation
@@ -69,16 +325,22 @@ class Snake(Individual):
             #@TODO: undo this
             # x = random.randint(10, self.board_size[0] - 9)
             # y = random.randint(10, self.board_size[1] - 9)
-            x = random.randint(2, self.board_size[0] - 3)
-            y = random.randint(2, self.board_size[1] - 3)
+            x = _randint(2, self.board_size[0] - 3, rng)
+            y = _randint(2, self.board_size[1] - 3, rng)
 
             start_pos = Point(x, y)
         self.start_pos = start_pos
 
-        self._vision_type = VISION_8
+        self.vision_type = vision_type
+        self._vision_type = get_vision_by_num(self.vision_type)
+        # Ray casts are looked up from tables shared by every snake on this board size
+        self._ray_tables = get_vision_tables(self.board_size, self.vision_type)
+        self._cell_points = get_cell_points(self.board_size)
         self._vision: List[Vision] = [None] * len(self._vision_type)
         # This is just used so I can draw and is not actually used in the NN
         self._drawable_vision: List[DrawableVision] = [None] * len(self._vision_type)
+        # For each of the ray tables, the sorted line positions of the body on each of its lines
+        self._line_bodies: Optional[List[List[List[int]]]] = None
 
         # Setting up network architecture
         # Each "Vision" has 3 distances it tracks: wall, apple and self
@@ -89,25 +351,29 @@ class Snake(Individual):
         self.network_architecture = [num_inputs]                          # Inputs
         self.network_architecture.extend(self.hidden_layer_architecture)  # Hidden layers
         self.network_architecture.append(4)                               # 4 outputs, ['u', 'd', 'l', 'r']
+
+        # If chromosome is set, take it. It's either already flat (W1, b1, W2, b2, ...)
+        # or a dictionary of weights and bias per layer, like load_snake gives.
+        flat_chromosome = None
+        if isinstance(chromosome, np.ndarray):
+            flat_chromosome = chromosome
+        elif chromosome:
+            flat_chromosome = np.empty(get_num_params(self.network_architecture))
+
         self.network = FeedForwardNetwork(self.network_architecture,
                                           get_activation_by_name(self.hidden_activation),
-                                          get_activation_by_name(self.output_activation)
+                                          get_activation_by_name(self.output_activation),
+                                          seed=rng,
+                                          chromosome=flat_chromosome
         )
-
-        # If chromosome is set, take it
-        if chromosome:
-            # self._chromosome = chromosome
-            self.network.params = chromosome
-            # self.decode_chromosome()
-        else:
-            # self._chromosome = {}
-            # self.encode_chromosome()
-            pass
-            
+        if isinstance(chromosome, dict):
+            self.network.load_params(chromosome)
+        # The network's W_l and b_l are views into this
+        self._chromosome = self.network.chromosome
 
         # For creating the next apple
         if apple_seed is None:
-            apple_seed = np.random.randint(-1000000000, 1000000000)
+            apple_seed = _random_apple_seed(rng)
         self.apple_seed = apple_seed  # Only needed for saving/loading replay
         self.rand_apple = random.Random(self.apple_seed)
 
@@ -115,7 +381,7 @@ class Snake(Individual):
         if starting_direction:
             starting_direction = starting_direction[0].lower()
         else:
-            starting_direction = self.possible_directions[random.randint(0, 3)]
+            starting_direction = self.possible_directions[_randint(0, 3, rng)]
 
         self.starting_direction = starting_direction  # Only needed for saving/loading replay
         self.init_snake(self.starting_direction)
@@ -123,47 +389,40 @@ class Snake(Individual):
         self.init_velocity(self.starting_direction, self.initial_velocity)
         self.generate_apple()
 
+        if self.detect_loops:
+            self._loop_hash_tables = get_loop_hash_tables(self.board_size)
+            self._body_hash = self._hash_body()
+            # States seen since the last apple
+            self._seen_states = {self._state_hash()}
+
     @property
     def fitness(self):
         return self._fitness
     
     def calculate_fitness(self):
-        # Give positive minimum fitness for roulette wheel selection
-        self._fitness = (self._frames) + ((2**self.score) + (self.score**2.1)*500) - (((.25 * self._frames)**1.3) * (self.score**1.2))
-        # self._fitness = (self._frames) + ((2**self.score) + (self.score**2.1)*500) - (((.25 * self._frames)) * (self.score))
-        self._fitness = max(self._fitness, .1)
+        self._fitness = snake_fitness(self._frames, self.score)
 
     @property
-    def chromosome(self):
-        # return self._chromosome
-        pass
+    def chromosome(self) -> np.ndarray:
+        return self._chromosome
 
     def encode_chromosome(self):
-        # # L = len(self.network.params) // 2
-        # L = len(self.network.layer_nodes)
-        # # Encode weights and bias
-        # for layer in range(1, L):
-        #     l = str(layer)
-        #     self._chromosome['W' + l] = self.network.params['W' + l].flatten()
-        #     self._chromosome['b' + l] = self.network.params['b' + l].flatten()
-        pass
+        L = len(self.network.layer_nodes)
+        # Encode weights and bias into one flat chromosome (W1, b1, W2, b2, ...)
+        self._chromosome = np.concatenate([self.network.params[name + str(l)].ravel() for l in range(1, L) for name in ('W', 'b')])
+        self.decode_chromosome()
 
     def decode_chromosome(self):
-        # # L = len(self.network.params) // 2
-        # L = len(self.network.layer_nodes)
-        # # Decode weights and bias
-        # for layer in range(1, L):
-        #     l = str(layer)
-        #     w_shape = (self.network_architecture[layer], self.network_architecture[layer-1])
-        #     b_shape = (self.network_architecture[layer], 1)
-        #     self.network.params['W' + l] = self._chromosome['W' + l].reshape(w_shape)
-        #     self.network.params['b' + l] = self._chromosome['b' + l].reshape(b_shape)
-        pass
+        # Decode weights and bias as views into the chromosome
+        self.network.set_chromosome(self._chromosome)
 
     def look(self):
+        head_cell = self._body[self._head_idx]
+        head = self._cell_points[head_cell]
         # Look all around
-        for i, slope in enumerate(self._vision_type):
-            vision, drawable_vision = self.look_in_direction(slope)
+        for i, table in enumerate(self._ray_tables):
+            vision, drawable_vision = self._look_along(table, head, head_cell,
+                                                       self._line_bodies[i] if self._line_bodies else None)
             self._vision[i] = vision
             self._drawable_vision[i] = drawable_vision
         
@@ -172,45 +431,52 @@ class Snake(Individual):
 
 
     def look_in_direction(self, slope: Slope) -> Tuple[Vision, DrawableVision]:
-        dist_to_wall = None
+        head_cell = self._body[self._head_idx]
+        head = self._cell_points[head_cell]
+        return self._look_along(get_ray_table(self.board_size, slope), head, head_cell)
+
+    def _look_along(self, table: RayTable, head: Point, head_cell: int,
+                    line_bodies: Optional[List[List[int]]] = None) -> Tuple[Vision, DrawableVision]:
         dist_to_apple = np.inf
         dist_to_self = np.inf
 
-        wall_location = None
         apple_location = None
         self_location = None
 
-        position = self.snake_array[0].copy()
-        distance = 1.0
-        total_distance = 0.0
-
-        # Can't start by looking at yourself
-        position.x += slope.run
-        position.y += slope.rise
-        total_distance += distance
-        body_found = False  # Only need to find the first occurance since it's the closest
-        food_found = False  # Although there is only one food, stop looking once you find it
-
-        # Keep going until the position is out of bounds
-        while self._within_wall(position):
-            if not body_found and self._is_body_location(position):
-                dist_to_self = total_distance
-                self_location = position.copy()
-                body_found = True
-            if not food_found and self._is_apple_location(position):
-                dist_to_apple = total_distance
-                apple_location = position.copy()
-                food_found = True
-
-            wall_location = position
-            position.x += slope.run
-            position.y += slope.rise
-            total_distance += distance
-        assert(total_distance != 0.0)
-
-
-        # @TODO: May need to adjust numerator in case of VISION_16 since step size isn't always going to be on a tile
-        dist_to_wall = 1.0 / total_distance
+        if line_bodies is not None:
+            # Closest body part further along the head's line than the head
+            position = table.line_positions[head_cell]
+            body = line_bodies[table.line_ids[head_cell]]
+            i = bisect_right(body, position)
+            if i < len(body):
+                dist_to_self = body[i] - position
+                self_location = self._cell_points[table.rays[head_cell][dist_to_self - 1]]
+        else:
+            # Can't start by looking at yourself, so the ray starts one step away from the head.
+            # Only need to find the first body part since it's the closest
+            occupancy = self._occupancy
+            for distance, cell in enumerate(table.rays[head_cell], 1):
+                if occupancy[cell]:
+                    dist_to_self = distance
+                    self_location = self._cell_points[cell]
+                    break
+
+        # There is only one apple, so rather than walking the ray just check whether it's on it
+        apple = self.apple_location
+        if apple is not None:
+            dx = apple.x - head.x
+            dy = apple.y - head.y
+            if table.run:
+                steps, remainder = divmod(dx, table.run)
+                on_ray = remainder == 0 and steps > 0 and steps * table.rise == dy
+            else:
+                steps, remainder = divmod(dy, table.rise)
+                on_ray = dx == 0 and remainder == 0 and steps > 0
+            if on_ray:
+                dist_to_apple = steps
+                apple_location = apple
+
+        dist_to_wall = table.dist_to_wall[head_cell]
 
         if self.apple_and_self_vision == 'binary':
             dist_to_apple = 1.0 if dist_to_apple != np.inf else 0.0
@@ -221,32 +487,20 @@ class Snake(Individual):
             dist_to_self = 1.0 / dist_to_self
 
         vision = Vision(dist_to_wall, dist_to_apple, dist_to_self)
-        drawable_vision = DrawableVision(wall_location, apple_location, self_location)
+        drawable_vision = DrawableVision(table.wall_locations[head_cell], apple_location, self_location)
         return (vision, drawable_vision)
 
     def _vision_as_input_array(self) -> None:
         # Split _vision into np array where rows [0-2] are _vision[0].dist_to_wall, _vision[0].dist_to_apple, _vision[0].dist_to_self,
         # rows [3-5] are _vision[1].dist_to_wall, _vision[1].dist_to_apple, _vision[1].dist_to_self, etc. etc. etc.
-        for va_index, v_index in zip(range(0, len(self._vision) * 3, 3), range(len(self._vision))):
-            vision = self._vision[v_index]
-            self.vision_as_array[va_index, 0]     = vision.dist_to_wall
-            self.vision_as_array[va_index + 1, 0] = vision.dist_to_apple
-            self.vision_as_array[va_index + 2, 0] = vision.dist_to_self
-
-        i = len(self._vision) * 3  # Start at the end
-
-        direction = self.direction[0].lower()
-        # One-hot encode direction
-        direction_one_hot = np.zeros((len(self.possible_directions), 1))
-        direction_one_hot[self.possible_directions.index(direction), 0] = 1
-        self.vision_as_array[i: i + len(self.possible_directions)] = direction_one_hot
-
-        i += len(self.possible_directions)
+        i = len(self._vision) * 3
+        inputs = self.vision_as_array[:, 0]
+        inputs[:i] = [dist for vision in self._vision for dist in (vision.dist_to_wall, vision.dist_to_apple, vision.dist_to_self)]
 
-        # One-hot tail direction
-        tail_direction_one_hot = np.zeros((len(self.possible_directions), 1))
-        tail_direction_one_hot[self.possible_directions.index(self.tail_direction), 0] = 1
-        self.vision_as_array[i: i + len(self.possible_directions)] = tail_direction_one_hot
+        # One-hot encode direction and tail direction, which come after the vision
+        inputs[i:] = 0.0
+        inputs[i + self.possible_directions.index(self.direction[0].lower())] = 1.0
+        inputs[i + len(self.possible_directions) + self.possible_directions.index(self.tail_direction)] = 1.0
 
     def _within_wall(self, position: Point) -> bool:
         return position.x >= 0 and position.y >= 0 and \
@@ -254,13 +508,10 @@ class Snake(Individual):
                position.y < self.board_size[1]
 
     def generate_apple(self) -> None:
-        width = self.board_size[0]
-        height = self.board_size[1]
-        # Find all possible points where the snake is not currently
-        possibilities = [divmod(i, height) for i in range(width * height) if divmod(i, height) not in self._body_locations]
+        # All possible points where the snake is not currently
+        possibilities = self._free_cells
         if possibilities:
-            loc = self.rand_apple.choice(possibilities)
-            self.apple_location = Point(loc[0], loc[1])
+            self.apple_location = self.rand_apple.choice(possibilities)
         else:
             # I guess you win?
             print('you won!')
@@ -287,10 +538,57 @@ class Snake(Individual):
         elif starting_direction == 'r':
             snake = [head, Point(head.x - 1, head.y), Point(head.x - 2, head.y)]
 
-        self.snake_array = deque(snake)
-        self._body_locations = set(snake)
+        num_cells = self.board_size[0] * self.board_size[1]
+        # The body is a ring buffer of cells (y * width + x), big enough for a snake that fills the board.
+        # Segment i (0 is the head) is _body[(_head_idx + i) % num_cells]
+        self._body = array('i', bytes(4 * num_cells))
+        self._head_idx = 0
+        self._length = len(snake)
+        # Occupancy of the body indexed by y * width + x, for collisions and vision
+        self._occupancy = bytearray(num_cells)
+        self._free_cells = FreeCells(self.board_size)
+        for i, point in enumerate(snake):
+            self._body[i] = point.y * self.board_size[0] + point.x
+            self._occupancy[self._body[i]] = 1
+            self._free_cells.occupy(point)
+        if self.incremental_vision:
+            self._line_bodies = [[[] for _ in range(table.num_lines)] for table in self._ray_tables]
+            for point in snake:
+                self._add_to_lines(point.y * self.board_size[0] + point.x)
         self.is_alive = True
 
+    @property
+    def snake_array(self) -> Deque[Point]:
+        """
+        The body as Points, head first. This is a copy, so changing it doesn't move the snake.
+        """
+        cells = self._body
+        num_cells = len(cells)
+        return deque(self._cell_points[cells[(self._head_idx + i) % num_cells]] for i in range(self._length))
+
+    @property
+    def head(self) -> Point:
+        return self._cell_points[self._body[self._head_idx]]
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    def _segment(self, i: int) -> int:
+        # Cell of the i-th segment. Negative i counts from the tail, like indexing a list
+        if i < 0:
+            i += self._length
+        return self._body[(self._head_idx + i) % len(self._body)]
+
+    def _add_to_lines(self, cell: int) -> None:
+        for table, line_bodies in zip(self._ray_tables, self._line_bodies):
+            insort(line_bodies[table.line_ids[cell]], table.line_positions[cell])
+
+    def _remove_from_lines(self, cell: int) -> None:
+        for table, line_bodies in zip(self._ray_tables, self._line_bodies):
+            body = line_bodies[table.line_ids[cell]]
+            del body[bisect_left(body, table.line_positions[cell])]
+
     def update(self):
         if self.is_alive:
             self._frames += 1
@@ -311,72 +609,137 @@ class Snake(Individual):
             return False
         
         # Find next position
-        # tail = self.snake_array.pop()  # Pop tail since we can technically move to the tail
-        head = self.snake_array[0]
+        width, height = self.board_size
+        body = self._body
+        num_cells = len(body)
+        head_idx = self._head_idx
+        head_cell = body[head_idx]
+        tail_idx = (head_idx + self._length - 1) % num_cells
+        y, x = divmod(head_cell, width)
         if direction == 'u':
-            next_pos = Point(head.x, head.y - 1)
+            y -= 1
         elif direction == 'd':
-            next_pos = Point(head.x, head.y + 1)
+            y += 1
         elif direction == 'r':
-            next_pos = Point(head.x + 1, head.y)
+            x += 1
         elif direction == 'l':
-            next_pos = Point(head.x - 1, head.y)
-
-        # Is the next position we want to move valid?
-        if self._is_valid(next_pos):
+            x -= 1
+
+        # Is the next position we want to move valid? Same check as _is_valid, but the ring buffer
+        # is already at hand and this runs every frame
+        next_cell = y * width + x
+        if 0 <= x < width and 0 <= y < height and (next_cell == body[tail_idx] or not self._occupancy[next_cell]):
+            ate = False
+            next_pos = self._cell_points[next_cell]
+            apple = self.apple_location
+            head_idx = self._head_idx = (head_idx - 1) % num_cells
             # Tail
-            if next_pos == self.snake_array[-1]:
-                # Pop tail and add next_pos (same as tail) to front
-                # No need to remove tail from _body_locations since it will go back in anyway
-                self.snake_array.pop()
-                self.snake_array.appendleft(next_pos) 
+            if next_cell == body[tail_idx]:
+                # The head goes right where the tail was, so occupancy doesn't change
+                tail = next_cell
+                body[head_idx] = next_cell
+                tail_idx = (tail_idx - 1) % num_cells
             # Eat the apple
-            elif next_pos == self.apple_location:
+            elif apple is not None and next_cell == apple.y * width + apple.x:
+                ate = True
+                tail = None
                 self.score += 1
                 self._frames_since_last_apple = 0
                 # Move head
-                self.snake_array.appendleft(next_pos)
-                self._body_locations.update({next_pos})
+                body[head_idx] = next_cell
+                self._length += 1
+                self._occupancy[next_cell] = 1
+                self._free_cells.occupy(next_pos)
+                if self._line_bodies:
+                    self._add_to_lines(next_cell)
                 # Don't remove tail since the snake grew
                 self.generate_apple()
             # Normal movement
             else:
                 # Move head
-                self.snake_array.appendleft(next_pos)
-                self._body_locations.update({next_pos})
+                body[head_idx] = next_cell
+                self._occupancy[next_cell] = 1
+                self._free_cells.occupy(next_pos)
+                if self._line_bodies:
+                    self._add_to_lines(next_cell)
                 # Remove tail
-                tail = self.snake_array.pop()
-                self._body_locations.symmetric_difference_update({tail})
+                tail = body[tail_idx]
+                tail_idx = (tail_idx - 1) % num_cells
+                self._occupancy[tail] = 0
+                self._free_cells.release(self._cell_points[tail])
+                if self._line_bodies:
+                    self._remove_from_lines(tail)
 
             # Figure out which direction the tail is moving
-            p2 = self.snake_array[-2]
-            p1 = self.snake_array[-1]
-            diff = p2 - p1
-            if diff.x < 0:
-                self.tail_direction = 'l'
-            elif diff.x > 0:
-                self.tail_direction = 'r'
-            elif diff.y > 0:
-                self.tail_direction = 'd'
-            elif diff.y < 0:
-                self.tail_direction = 'u'
+            self.tail_direction = self.possible_directions[self._direction_to(body[tail_idx], body[(tail_idx - 1) % num_cells])]
 
             self._frames_since_last_apple += 1
-            #@NOTE: If you have different sized grids you may want to change this
-            if self._frames_since_last_apple > 100:
+            if self._frames_since_last_apple > self.starvation_limit:
                 self.is_alive = False
+                self.death_cause = 'starvation'
                 return False
 
+            if self.detect_loops:
+                self._update_body_hash(head_cell, next_cell, direction, tail)
+                if ate:
+                    # States from before can't come back since the snake is longer now
+                    self._seen_states.clear()
+                state = self._state_hash()
+                if state in self._seen_states:
+                    # Same state as before without eating, so it will repeat this until it starves
+                    self._frames += self.starvation_limit + 1 - self._frames_since_last_apple
+                    self._frames_since_last_apple = self.starvation_limit + 1
+                    self.is_alive = False
+                    self.death_cause = 'starvation'
+                    return False
+                self._seen_states.add(state)
+
             return True
         else:
             self.is_alive = False
+            self.death_cause = 'self' if 0 <= x < width and 0 <= y < height else 'wall'
             return False
 
+    def _direction_to(self, cell1: int, cell2: int) -> int:
+        # Index into possible_directions of the step from cell1 to the neighbouring cell2
+        diff = cell2 - cell1
+        if diff == 1:
+            return 3
+        elif diff == -1:
+            return 2
+        elif diff > 0:
+            return 1
+        return 0
+
+    def _hash_body(self) -> int:
+        tables = self._loop_hash_tables
+        h = tables.head_keys[self._segment(0)]
+        for i in range(1, self._length):
+            segment = self._segment(i)
+            h ^= tables.link_keys[segment * 4 + self._direction_to(segment, self._segment(i - 1))]
+        return h
+
+    def _update_body_hash(self, old_head_cell: int, new_head_cell: int, direction: str, removed_tail: Optional[int]) -> None:
+        tables = self._loop_hash_tables
+        # The old head is now a segment pointing at the new head
+        self._body_hash ^= tables.head_keys[old_head_cell] ^ tables.head_keys[new_head_cell] ^ \
+                           tables.link_keys[old_head_cell * 4 + self.possible_directions.index(direction)]
+        if removed_tail is not None:
+            self._body_hash ^= tables.link_keys[removed_tail * 4 + self._direction_to(removed_tail, self._segment(-1))]
+
+    def _state_hash(self) -> int:
+        tables = self._loop_hash_tables
+        apple = self.apple_location
+        apple_cell = apple.y * self.board_size[0] + apple.x if apple else self.board_size[0] * self.board_size[1]
+        return self._body_hash ^ tables.apple_keys[apple_cell] ^ \
+               tables.direction_keys[self.possible_directions.index(self.direction)] ^ \
+               tables.tail_direction_keys[self.possible_directions.index(self.tail_direction)]
+
     def _is_apple_location(self, position: Point) -> bool:
         return position == self.apple_location
 
     def _is_body_location(self, position: Point) -> bool:
-        return position in self._body_locations
+        return self._within_wall(position) and self._occupancy[position.y * self.board_size[0] + position.x] == 1
 
     def _is_valid(self, position: Point) -> bool:
         """
@@ -389,11 +752,12 @@ class Snake(Individual):
         if (position.y < 0) or (position.y > self.board_size[1] - 1):
             return False
 
-        if position == self.snake_array[-1]:
+        cell = position.y * self.board_size[0] + position.x
+        if cell == self._body[(self._head_idx + self._length - 1) % len(self._body)]:
             return True
         # If the position is a body location, not valid.
-        # @NOTE: _body_locations will contain tail, so need to check tail first
-        elif position in self._body_locations:
+        # @NOTE: _occupancy will contain tail, so need to check tail first
+        elif self._occupancy[cell]:
             return False
         # Otherwise you good
         else:
@@ -450,7 +814,113 @@ def save_snake(population_folder: str, individual_name: str, snake: Snake, setti
         np.save(os.path.join(individual_dir, w_name), weights)
         np.save(os.path.join(individual_dir, b_name), bias)
 
-def load_snake(population_folder: str, individual_name: str, settings: Optional[Union[Dict[str, Any], str]] = None) -> Snake:
+# Snake archives pack many snakes into one file instead of a folder of .npy files per snake.
+# Layout:
+#   header:  ARCHIVE_MAGIC, then the number of bytes that have been fully written (uint64)
+#   entries: uint64 length of the JSON metadata, the JSON metadata (padded to 8 bytes),
+#            then num_params float64 weights (the flat chromosome, W1, b1, W2, b2, ...)
+# The first entry holds the settings and has no weights. Entries are only ever appended and the
+# header is updated last, so a crash while saving just loses that snake.
+# Weights are stored raw (not compressed) so they can be memory mapped when loading.
+ARCHIVE_MAGIC = b'SNAKEARC'
+_ARCHIVE_HEADER = struct.Struct('<8sQ')
+_ARCHIVE_ENTRY_LENGTH = struct.Struct('<Q')
+
+def _write_archive_entry(fp, meta: Dict[str, Any], weights: Optional[np.ndarray] = None) -> None:
+    encoded = json.dumps(meta).encode('utf-8')
+    encoded += b' ' * (-len(encoded) % 8)
+    fp.write(_ARCHIVE_ENTRY_LENGTH.pack(len(encoded)))
+    fp.write(encoded)
+    if weights is not None:
+        fp.write(np.ascontiguousarray(weights, dtype='<f8').tobytes())
+
+def _read_archive_header(fp, archive_path: str) -> int:
+    # Returns the end of what has been fully written
+    header = fp.read(_ARCHIVE_HEADER.size)
+    if len(header) < _ARCHIVE_HEADER.size or header[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+        raise Exception('"{}" is not a snake archive'.format(archive_path))
+    _, end = _ARCHIVE_HEADER.unpack(header)
+    # Appending would write over the header, so don't touch it
+    if end <= _ARCHIVE_HEADER.size:
+        raise Exception('"{}" was never finished being created (no settings in it)'.format(archive_path))
+    return end
+
+def save_snake_to_archive(archive_path: str, individual_name: str, snake: Union[Snake, 'SnakeGenome'], settings: Dict[str, Any],
+                          generation: Optional[int] = None) -> None:
+    """
+    Append a snake (or SnakeGenome) to an archive, creating it if it doesn't exist.
+    Saves the same information as save_snake. If a name is saved twice, load_snake gives the newest one.
+    """
+    if not os.path.exists(archive_path):
+        # Written next to the archive and then moved into place (like Trainer.save_checkpoint),
+        # so a crash here never leaves an archive without its header and settings
+        tmp_path = archive_path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, 0))
+            _write_archive_entry(fp, {'settings': settings, 'num_params': 0})
+            end = fp.tell()
+            fp.seek(0)
+            fp.write(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, end))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, archive_path)
+
+    with open(archive_path, 'r+b') as fp:
+        end = _read_archive_header(fp, archive_path)
+
+        meta = {
+            'name': individual_name,
+            'generation': generation,
+            'start_pos': snake.start_pos.to_dict(),
+            'apple_seed': snake.apple_seed,
+            'initial_velocity': getattr(snake, 'initial_velocity', None),
+            'starting_direction': snake.starting_direction,
+            'num_params': int(snake.chromosome.shape[0])
+        }
+        # Anything past the end is from a save that didn't finish, so write over it
+        fp.seek(end)
+        _write_archive_entry(fp, meta, snake.chromosome)
+        fp.truncate()
+        fp.flush()
+        os.fsync(fp.fileno())
+        end = fp.tell()
+        fp.seek(0)
+        fp.write(_ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, end))
+
+def load_archive_index(archive_path: str) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Read the settings and the metadata of every snake in an archive, without reading any weights.
+    Returns (settings, {name: metadata}). Each metadata has an 'offset' to where its weights start.
+    """
+    index = {}
+    with open(archive_path, 'rb') as fp:
+        end = _read_archive_header(fp, archive_path)
+
+        settings = None
+        position = fp.tell()
+        while position < end:
+            length, = _ARCHIVE_ENTRY_LENGTH.unpack(fp.read(_ARCHIVE_ENTRY_LENGTH.size))
+            meta = json.loads(fp.read(length).decode('utf-8'))
+            meta['offset'] = position + _ARCHIVE_ENTRY_LENGTH.size + length
+            position = meta['offset'] + meta['num_params'] * 8
+            fp.seek(position)
+
+            if 'settings' in meta:
+                settings = meta['settings']
+            else:
+                index[meta['name']] = meta
+
+    return settings, index
+
+def load_snake(population_folder: str, individual_name: Union[str, int], settings: Optional[Union[Dict[str, Any], str]] = None) -> Snake:
+    """
+    Load a snake saved with save_snake, or with save_snake_to_archive if population_folder is an archive file.
+    For an archive, individual_name can also be a generation number, which loads the latest snake saved
+    for that generation.
+    """
+    if os.path.isfile(population_folder):
+        return _load_snake_from_archive(population_folder, individual_name, settings)
+
     if not settings:
         f = os.path.join(population_folder, 'settings.json')
         if not os.path.exists(f):
@@ -491,6 +961,44 @@ def load_snake(population_folder: str, individual_name: str, settings: Optional[
                   hidden_activation=settings['hidden_layer_activation'],
                   output_activation=settings['output_layer_activation'],
                   lifespan=settings['lifespan'],
-                  apple_and_self_vision=settings['apple_and_self_vision']
+                  apple_and_self_vision=settings['apple_and_self_vision'],
+                  vision_type=settings['vision_type'],
+                  starvation_limit=get_starvation_limit_from_settings(settings)
+                  )
+    return snake
+
+def _load_snake_from_archive(archive_path: str, individual_name: Union[str, int], settings: Optional[Union[Dict[str, Any], str]] = None) -> Snake:
+    archive_settings, index = load_archive_index(archive_path)
+    if not settings:
+        settings = archive_settings
+    elif isinstance(settings, str):
+        with open(settings, 'r', encoding='utf-8') as fp:
+            settings = json.load(fp)
+
+    if isinstance(individual_name, int):
+        matches = [meta for meta in index.values() if meta['generation'] == individual_name]
+        if not matches:
+            raise Exception('No snake from generation {} in "{}"'.format(individual_name, archive_path))
+        meta = max(matches, key=lambda meta: meta['offset'])
+    elif individual_name in index:
+        meta = index[individual_name]
+    else:
+        raise Exception('No snake named "{}" in "{}"'.format(individual_name, archive_path))
+
+    # Copy-on-write map of the weights, so nothing is read until the network uses it and the archive is never modified
+    chromosome = np.memmap(archive_path, dtype='<f8', mode='c', offset=meta['offset'], shape=(meta['num_params'],))
+
+    snake = Snake(settings['board_size'], chromosome=chromosome,
+                  start_pos=Point.from_dict(meta['start_pos']),
+                  apple_seed=meta['apple_seed'],
+                  initial_velocity=meta['initial_velocity'],
+                  starting_direction=meta['starting_direction'],
+                  hidden_layer_architecture=settings['hidden_network_architecture'],
+                  hidden_activation=settings['hidden_layer_activation'],
+                  output_activation=settings['output_layer_activation'],
+                  lifespan=settings['lifespan'],
+                  apple_and_self_vision=settings['apple_and_self_vision'],
+                  vision_type=settings['vision_type'],
+                  starvation_limit=get_starvation_limit_from_settings(settings)
                   )
     return snake
\ No newline at end of file
@@ -0,0 +1,201 @@
+import json
+import os
+import queue
+import threading
+from typing import List, Tuple, Optional, Dict, Any
+import numpy as np
+
+from misc import DEATH_CAUSES
+from genetic_algorithm.population import Population
+
+
+# Same trackers and stats as snake_app.save_stats, plus how many snakes died each way
+TRACKERS = ('steps', 'apples', 'fitness')
+STATS = ('mean', 'median', 'std', 'min', 'max')
+AGGREGATE_COLUMNS = [('generation', '<i8'), ('count', '<i8')] + \
+                    [('{}_{}'.format(tracker, stat), '<f8') for tracker in TRACKERS for stat in STATS] + \
+                    [('deaths_{}'.format(cause), '<i8') for cause in DEATH_CAUSES]
+# Per-individual values. death_cause is an index into DEATH_CAUSES, -1 if the snake didn't die
+DISTRIBUTION_COLUMNS = [('steps', '<i8'), ('apples', '<i8'), ('fitness', '<f8'), ('death_cause', '<i1')]
+
+
+class StatsWriter(object):
+    """
+    Writes per-generation statistics to a folder in a columnar format: one raw binary file per column,
+    appended to every generation, plus columns.json describing them. load_stats reads a whole
+    column back with a single np.fromfile.
+
+    add_generation only copies the population's results into NumPy arrays. Calculating the stats and
+    writing them happens on a background thread so the next generation can start right away.
+    If distributions is True, every individual's steps, apples, fitness and death cause are written too.
+
+    Columns are appended to, so a folder that already has stats in it is refused unless start_generation is given
+    (i.e. the run is being resumed). Then every generation from start_generation on is cut off first, since the
+    resumed run is about to write those again.
+    """
+    def __init__(self, path_to_dir: str, distributions: Optional[bool] = False, start_generation: Optional[int] = None):
+        self.path_to_dir = path_to_dir
+        self.distributions = distributions
+        if not os.path.exists(self.path_to_dir):
+            os.makedirs(self.path_to_dir)
+
+        if os.listdir(self.path_to_dir):
+            if start_generation is None or not os.path.exists(os.path.join(self.path_to_dir, 'columns.json')):
+                raise Exception('"{}" is not empty. Write stats to a new folder, or resume the run that wrote them'.format(self.path_to_dir))
+            self._truncate(start_generation)
+
+        with open(os.path.join(self.path_to_dir, 'columns.json'), 'w', encoding='utf-8') as fp:
+            json.dump({'aggregates': AGGREGATE_COLUMNS,
+                       'distributions': DISTRIBUTION_COLUMNS if self.distributions else [],
+                       'death_causes': DEATH_CAUSES}, fp, indent=4)
+
+        self._error: Optional[BaseException] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_generation(self, generation: int, population: Population) -> None:
+        """
+        Queue up the results of an evaluated population.
+        """
+        self._raise_error()
+        individuals = population.individuals
+        n = len(individuals)
+        columns = {
+            'steps': np.fromiter((individual._frames for individual in individuals), dtype=np.int64, count=n),
+            'apples': np.fromiter((individual.score for individual in individuals), dtype=np.int64, count=n),
+            'fitness': np.fromiter((individual.fitness for individual in individuals), dtype=np.float64, count=n),
+            'death_cause': np.fromiter((DEATH_CAUSES.index(individual.death_cause) if individual.death_cause else -1
+                                        for individual in individuals), dtype=np.int8, count=n)
+        }
+        self._queue.put((generation, columns))
+
+    def flush(self) -> None:
+        """
+        Wait until everything queued so far is on disk.
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _truncate(self, start_generation: int) -> None:
+        # Cut every column back to the generations before start_generation
+        with open(os.path.join(self.path_to_dir, 'columns.json'), 'r', encoding='utf-8') as fp:
+            columns = json.load(fp)
+        if bool(columns['distributions']) != bool(self.distributions):
+            raise Exception('"{}" was written {} distributions'.format(self.path_to_dir, 'with' if columns['distributions'] else 'without'))
+
+        aggregates = _read_columns(self.path_to_dir, [('generation', '<i8'), ('count', '<i8')])
+        num_rows = int(np.count_nonzero(aggregates['generation'] < start_generation))
+        num_individuals = int(np.sum(aggregates['count'][:num_rows]))
+        for name, dtype in AGGREGATE_COLUMNS:
+            self._truncate_column(name, num_rows * np.dtype(dtype).itemsize)
+        if self.distributions:
+            for name, dtype in DISTRIBUTION_COLUMNS:
+                self._truncate_column(os.path.join('distributions', name), num_individuals * np.dtype(dtype).itemsize)
+
+    def _truncate_column(self, name: str, size: int) -> None:
+        path = os.path.join(self.path_to_dir, name + '.bin')
+        if os.path.exists(path):
+            with open(path, 'r+b') as fp:
+                fp.truncate(min(size, os.path.getsize(path)))
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise Exception('Writing stats failed') from self._error
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._write(*item)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, generation: int, columns: Dict[str, np.ndarray]) -> None:
+        row = {'generation': generation, 'count': len(columns['steps'])}
+        for tracker in TRACKERS:
+            data = columns[tracker]
+            row[tracker + '_mean'] = np.mean(data)
+            row[tracker + '_median'] = np.median(data)
+            row[tracker + '_std'] = np.std(data)
+            row[tracker + '_min'] = np.min(data)
+            row[tracker + '_max'] = np.max(data)
+        death_counts = np.bincount(columns['death_cause'][columns['death_cause'] >= 0], minlength=len(DEATH_CAUSES))
+        for i, cause in enumerate(DEATH_CAUSES):
+            row['deaths_' + cause] = death_counts[i]
+
+        # Distributions go first, so a generation's aggregates are never on disk without its distribution
+        if self.distributions:
+            for name, dtype in DISTRIBUTION_COLUMNS:
+                self._append(os.path.join('distributions', name), np.asarray(columns[name], dtype=dtype))
+        for name, dtype in AGGREGATE_COLUMNS:
+            self._append(name, np.array([row[name]], dtype=dtype))
+
+    def _append(self, name: str, data: np.ndarray) -> None:
+        path = os.path.join(self.path_to_dir, name + '.bin')
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'ab') as fp:
+            data.tofile(fp)
+
+
+def _read_columns(path_to_dir: str, columns: List[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+    data = {}
+    for name, dtype in columns:
+        path = os.path.join(path_to_dir, name + '.bin')
+        data[name] = np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.empty(0, dtype=dtype)
+    # If a write was interrupted some columns can be a row longer than others
+    rows = min(len(column) for column in data.values())
+    return {name: column[:rows] for name, column in data.items()}
+
+def load_stats(path_to_dir: str, normalize: Optional[bool] = True) -> Dict[str, Any]:
+    """
+    Load the aggregates written by StatsWriter.
+    Returns data[tracker][stat] as arrays with one entry per generation, the same layout as snake_app.load_stats,
+    plus data['generation'], data['count'] and data['deaths'][cause].
+    If normalize is True, every tracker stat is divided by its largest absolute value.
+    """
+    with open(os.path.join(path_to_dir, 'columns.json'), 'r', encoding='utf-8') as fp:
+        columns = json.load(fp)
+    raw = _read_columns(path_to_dir, columns['aggregates'])
+
+    data = {'generation': raw['generation'], 'count': raw['count'], 'deaths': {}}
+    for tracker in TRACKERS:
+        data[tracker] = {}
+        for stat in STATS:
+            values = raw['{}_{}'.format(tracker, stat)]
+            if normalize and len(values):
+                max_val = np.max(np.abs(values))
+                values = values / (max_val if max_val else 1.0)
+            data[tracker][stat] = values
+    for cause in columns['death_causes']:
+        data['deaths'][cause] = raw['deaths_' + cause]
+
+    return data
+
+def load_distributions(path_to_dir: str) -> Dict[str, np.ndarray]:
+    """
+    Load every individual's steps, apples, fitness and death cause written by StatsWriter(distributions=True).
+    Individuals of every generation are concatenated. data['offsets'][g]:data['offsets'][g+1] is the slice for the
+    g-th generation that was written (data['generation'][g]).
+    """
+    with open(os.path.join(path_to_dir, 'columns.json'), 'r', encoding='utf-8') as fp:
+        columns = json.load(fp)
+    if not columns['distributions']:
+        raise Exception('No distributions were written to "{}"'.format(path_to_dir))
+
+    aggregates = _read_columns(path_to_dir, [('generation', '<i8'), ('count', '<i8')])
+    data = _read_columns(os.path.join(path_to_dir, 'distributions'), columns['distributions'])
+    data['generation'] = aggregates['generation']
+    data['offsets'] = np.concatenate([[0], np.cumsum(aggregates['count'])])
+    return data
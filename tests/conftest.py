@@ -0,0 +1,78 @@
+import copy
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live at the top of the repo, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def settings():
+    """
+    settings.py shrunk down so a few generations only take a moment.
+    use_numba is off by default, so games are played by Snake, the reference everything else has to match.
+    """
+    from settings import settings
+    small = copy.deepcopy(settings)
+    small.update({
+        'board_size': (10, 10),
+        'hidden_network_architecture': [12, 8],
+        'num_parents': 20,
+        'num_offspring': 40
+    })
+    return small
+
+
+@pytest.fixture
+def chaser_settings(settings):
+    """
+    Settings for snakes driven by apple_chaser: 4 directions of distance vision and one hidden layer of 4.
+    """
+    settings.update({
+        'vision_type': 4,
+        'apple_and_self_vision': 'distance',
+        'hidden_network_architecture': [4],
+        'detect_loops': False
+    })
+    return settings
+
+
+def apple_chaser(vision_type: int = 4) -> np.ndarray:
+    """
+    Hand made chromosome for chaser_settings. Each hidden node scores one direction: head for an apple it can see,
+    stay away from walls and its body right next to it, otherwise keep going. These snakes grow long, turn into
+    their own tail and end up in loops, which random networks hardly ever do.
+    """
+    # Inputs are [wall, apple, self] for each vision line (clockwise from up), then the one-hot direction.
+    # Hidden node k (and output k) is possible_directions[k]: up, down, left, right
+    vision_line = (0, vision_type // 2, 3 * vision_type // 4, vision_type // 4)
+    num_inputs = vision_type * 3 + 4 + 4
+    W1 = np.zeros((4, num_inputs))
+    for k, line in enumerate(vision_line):
+        W1[k, 3 * line:3 * line + 3] = (-1.5, 1.0, -1.5)
+        W1[k, vision_type * 3 + k] = 0.2
+    b1 = np.full(4, 3.0)
+    return np.concatenate([W1.ravel(), b1, np.eye(4).ravel(), np.zeros(4)])
+
+
+@pytest.fixture
+def make_genomes(chaser_settings):
+    """
+    Returns a function giving fresh genomes for chaser_settings: apple chasers on different boards plus random
+    networks, which mostly run into a wall or themselves.
+    """
+    from snake import SnakeGenome
+
+    def make(num_genomes: int = 40, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        board_size = tuple(chaser_settings['board_size'])
+        genomes = []
+        for i in range(num_genomes):
+            chaser = apple_chaser(chaser_settings['vision_type'])
+            chromosome = chaser if i % 2 == 0 else rng.uniform(-1, 1, chaser.size)
+            genomes.append(SnakeGenome(board_size, chromosome, rng=rng))
+        return genomes
+    return make
@@ -0,0 +1,32 @@
+import pytest
+
+from compiled_game import CompiledGame
+from trainer import Trainer
+
+
+# Without numba the kernel runs as plain Python, so this is slow but checks the same code
+@pytest.mark.parametrize('detect_loops', [False, True])
+def test_compiled_game_matches_snake(chaser_settings, make_genomes, detect_loops):
+    chaser_settings['detect_loops'] = detect_loops
+    trainer = Trainer(chaser_settings, seed=1)
+    game = CompiledGame.from_settings(chaser_settings)
+    for genome in make_genomes():
+        snake = trainer.create_snake(genome)
+        Trainer.play(snake)
+        assert game.play(genome.chromosome, genome.start_pos, genome.apple_seed, genome.starting_direction) == \
+               (snake.score, snake._frames, snake.death_cause)
+
+
+def test_trainer_plays_compiled_games(chaser_settings, make_genomes):
+    # The compiled path only exists with numba. Compare what the trainer gets from it with Snake
+    pytest.importorskip('numba')
+    expected = make_genomes()
+    Trainer(chaser_settings, seed=1).play_genomes(expected)
+
+    chaser_settings['use_numba'] = True
+    trainer = Trainer(chaser_settings, seed=1)
+    assert trainer._compiled_game is not None
+    genomes = make_genomes()
+    trainer.play_genomes(genomes)
+    assert [(genome.score, genome._frames, genome.death_cause) for genome in genomes] == \
+           [(genome.score, genome._frames, genome.death_cause) for genome in expected]
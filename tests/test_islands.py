@@ -0,0 +1,43 @@
+import pytest
+
+from islands import check_island_settings, check_migration, vary_settings, emigrants, immigrate, run_islands
+from trainer import Trainer
+
+
+@pytest.mark.parametrize('key, values', [('vision_type', [8, 4]), ('num_episodes', [1, 3]),
+                                         ('starvation_limit', [100, 200]), ('detect_loops', [True, False])])
+def test_islands_have_to_share_the_game_and_fitness(settings, key, values):
+    check_island_settings(vary_settings([settings, settings], {'mutation_rate': [0.05, 0.1]}))
+    with pytest.raises(Exception):
+        check_island_settings(vary_settings([settings, settings], {key: values}))
+
+
+def test_migrants_replace_the_worst(settings):
+    home = Trainer(settings, seed=1)
+    away = Trainer(settings, seed=2)
+    for trainer in (home, away):
+        trainer.evaluate_population()
+    migrants = emigrants(away, 5)
+    best = [individual.chromosome.tobytes() for individual in away.ranked_individuals()[:5]]
+    kept = [individual.chromosome.tobytes() for individual in home.ranked_individuals()[:-5]]
+
+    immigrate(home, migrants)
+    population = [individual.chromosome.tobytes() for individual in home.population.individuals]
+    assert len(population) == settings['num_parents']
+    assert sorted(population) == sorted(kept + best)
+    fitnesses = [individual.fitness for individual in home.ranked_individuals()]
+    assert fitnesses == sorted(fitnesses, reverse=True)
+
+
+def test_seed_reproduces_an_island_run(settings):
+    runs = [run_islands([settings, settings], 3, migration_interval=1, num_migrants=2, seed=9, verbose=False)
+            for _ in range(2)]
+    assert runs[0] == runs[1]
+
+
+@pytest.mark.parametrize('migration_interval, num_migrants', [(0, 2), (-1, 2), (1, -1), (1, 21)])
+def test_bad_migration_is_refused_before_islands_start(settings, migration_interval, num_migrants):
+    check_migration([settings, settings], 1, settings['num_parents'])
+    with pytest.raises(Exception):
+        run_islands([settings, settings], 1, migration_interval=migration_interval, num_migrants=num_migrants,
+                    verbose=False)
@@ -0,0 +1,22 @@
+import numpy as np
+
+from neural_network import FeedForwardNetwork, BatchFeedForwardNetwork, sigmoid, relu, random_chromosome
+
+
+def test_batch_network_matches_single_networks_as_rows_drop_out():
+    layer_nodes = [6, 5, 4]
+    rng = np.random.default_rng(0)
+    chromosomes = np.stack([random_chromosome(layer_nodes, rng) for _ in range(20)])
+    networks = [FeedForwardNetwork(layer_nodes, relu, sigmoid, chromosome=c) for c in chromosomes]
+    batch = BatchFeedForwardNetwork.from_chromosomes(layer_nodes, relu, sigmoid, chromosomes)
+
+    # Drop a few networks at a time so the stacks are both padded and regathered, then bring them all back
+    rows = np.arange(20)
+    for _ in range(12):
+        X = rng.uniform(-1, 1, (len(rows), 6))
+        out = batch.feed_forward(X, rows)
+        for i, row in enumerate(rows):
+            assert np.array_equal(out[i], networks[row].feed_forward(X[i][:, np.newaxis])[:, 0])
+        rows = np.sort(rng.choice(rows, max(len(rows) - 2, 1), replace=False))
+    X = rng.uniform(-1, 1, (20, 6))
+    assert np.array_equal(batch.feed_forward(X, np.arange(20)), batch.feed_forward(X))
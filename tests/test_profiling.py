@@ -0,0 +1,26 @@
+from profiling import Profiler
+from trainer import Trainer
+
+
+def test_profiler_counts_games_and_skips_paused_work(settings):
+    settings['num_episodes'] = 3
+    trainer = Trainer(settings, seed=1)
+    profiler = Profiler(trainer_class=Trainer)
+    profiler.enable()
+    try:
+        trainer.evaluate_population()
+        profiler.count_population(trainer.population)
+        moves = profiler.calls['Snake.move']
+        with profiler.paused():
+            trainer.replay_genome(trainer.population.fittest_individual)
+        assert profiler.calls['Snake.move'] == moves
+        record = profiler.end_generation(0)
+    finally:
+        profiler.disable()
+
+    counters = record['counters']
+    assert counters['games'] == 3 * counters['snakes']
+    evaluation_seconds = record['timers']['Trainer.evaluate_population']['seconds']
+    assert counters['games_per_sec'] == counters['games'] / evaluation_seconds
+    # Loop detection skips the frames a looping snake would have played, so there can be fewer moves than frames
+    assert 0 < record['timers']['Snake.move']['calls'] <= counters['frames']
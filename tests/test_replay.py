@@ -0,0 +1,48 @@
+import pytest
+
+from replay import Replay, ReplayPlayer, record_replay
+from trainer import Trainer
+
+
+def board(state):
+    return (list(state.snake_array), state.apple_location, state.direction, state.tail_direction,
+            state.score, state.is_alive)
+
+
+@pytest.mark.parametrize('keyframe_interval', [1, 7, 100])
+def test_replay_rebuilds_every_frame(chaser_settings, make_genomes, tmp_path, keyframe_interval):
+    trainer = Trainer(chaser_settings, seed=2)
+    genomes = make_genomes()
+    trainer.play_genomes(genomes)
+    # The longest games have the most to get wrong
+    for genome in sorted(genomes, key=lambda genome: genome._frames)[-3:]:
+        path = str(tmp_path / 'replay.npz')
+        record_replay(trainer.create_snake(genome), keyframe_interval=keyframe_interval).save(path)
+        player = ReplayPlayer(Replay.load(path))
+        assert player.num_frames == genome._frames
+
+        snake = trainer.create_snake(genome)
+        for frame in range(player.num_frames + 1):
+            assert board(player.state_at(frame)) == board(snake)
+            snake.update()
+            snake.move()
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'batch': True}, {'num_workers': 2}])
+def test_trainer_replays_the_evaluated_game(chaser_settings, make_genomes, kwargs):
+    chaser_settings.update({'detect_loops': True, 'num_episodes': 2})
+    trainer = Trainer(chaser_settings, seed=2, **kwargs)
+    trainer.population.individuals = make_genomes()
+    trainer.evaluate_population()
+    trainer.close()
+    for genome in trainer.population.individuals:
+        replay = trainer.replay_genome(genome)
+        assert (replay.score, replay.frames) == (genome.score, genome._frames)
+
+
+def test_no_replays_from_the_compiled_game(chaser_settings, make_genomes):
+    pytest.importorskip('numba')
+    chaser_settings['use_numba'] = True
+    trainer = Trainer(chaser_settings, seed=2)
+    with pytest.raises(Exception):
+        trainer.replay_genome(make_genomes(1)[0])
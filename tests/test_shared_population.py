@@ -0,0 +1,22 @@
+import numpy as np
+
+from shared_population import SharedPopulation
+
+
+def test_workers_see_the_same_population(make_genomes):
+    genomes = make_genomes(10)
+    population = SharedPopulation(16, genomes[0].chromosome.size)
+    try:
+        population.write_genomes(genomes)
+        attached = SharedPopulation.attach(population.capacity, population.num_genes, population.names)
+        assert np.array_equal(attached.chromosomes[:10], np.stack([genome.chromosome for genome in genomes]))
+        assert attached.games[:10, 2].tolist() == [genome.apple_seed for genome in genomes]
+
+        # What a worker writes back is read as if the game was played here
+        attached.results[3] = (4, 120, 0.0, 2)
+        attached.close()
+        population.read_results(genomes)
+        assert (genomes[3].score, genomes[3]._frames, genomes[3].death_cause) == (4, 120, 'starvation')
+        assert genomes[4].death_cause is None
+    finally:
+        population.unlink()
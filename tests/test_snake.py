@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from snake import Snake
+from trainer import Trainer
+
+
+def play_both(first, second, check):
+    """
+    Step two snakes that should play the same game side by side, calling check(first, second) on every frame
+    once both have looked.
+    """
+    while first.is_alive or second.is_alive:
+        first.update()
+        second.update()
+        check(first, second)
+        first.move()
+        second.move()
+    assert (first.score, first._frames, first.death_cause) == (second.score, second._frames, second.death_cause)
+
+
+def same_vision(walking, bisecting):
+    assert np.array_equal(walking.vision_as_array, bisecting.vision_as_array)
+    assert [(v.wall_location, v.apple_location, v.self_location) for v in walking._drawable_vision] == \
+           [(v.wall_location, v.apple_location, v.self_location) for v in bisecting._drawable_vision]
+
+
+@pytest.mark.parametrize('vision_type', [4, 8, 16])
+def test_incremental_vision_matches_on_long_games(chaser_settings, make_genomes, vision_type):
+    chaser_settings['vision_type'] = vision_type
+    trainer = Trainer(chaser_settings, seed=1)
+    for genome in make_genomes():
+        walking = trainer.create_snake(genome)
+        chaser_settings['incremental_vision'] = True
+        bisecting = trainer.create_snake(genome)
+        chaser_settings['incremental_vision'] = False
+        play_both(walking, bisecting, same_vision)
+
+
+@pytest.mark.parametrize('vision_type', [4, 8, 16])
+@pytest.mark.parametrize('board_size', [(10, 10), (13, 7)])
+def test_incremental_vision_matches_on_every_slope(vision_type, board_size):
+    for seed in range(10):
+        walking, bisecting = (Snake(board_size, hidden_layer_architecture=[8], vision_type=vision_type,
+                                    apple_and_self_vision='distance', rng=np.random.default_rng(seed),
+                                    incremental_vision=incremental)
+                              for incremental in (False, True))
+        play_both(walking, bisecting, same_vision)
+
+
+def test_body_ring_buffer_stays_consistent(chaser_settings, make_genomes):
+    trainer = Trainer(chaser_settings, seed=1)
+    width, height = chaser_settings['board_size']
+    for genome in make_genomes():
+        snake = trainer.create_snake(genome)
+        while snake.is_alive:
+            body = list(snake.snake_array)
+            assert len(body) == len(set(body)) == snake.length
+            assert body[0] == snake.head
+            # Every segment is next to the one before it
+            assert all(abs(a.x - b.x) + abs(a.y - b.y) == 1 for a, b in zip(body, body[1:]))
+            occupied = set((i % width, i // width) for i, cell in enumerate(snake._occupancy) if cell)
+            assert occupied == set((point.x, point.y) for point in body)
+            assert len(snake._free_cells) == width * height - snake.length
+            assert snake.apple_location not in body
+            snake.update()
+            snake.move()
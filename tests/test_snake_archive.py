@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from snake import save_snake, save_snake_to_archive, load_snake, load_archive_index, ARCHIVE_MAGIC
+from trainer import Trainer
+
+
+def play_to_death(snake):
+    Trainer.play(snake)
+    return snake.score, snake._frames, snake.death_cause
+
+
+@pytest.fixture
+def trainer(settings):
+    trainer = Trainer(settings, seed=11)
+    trainer.evaluate_population()
+    return trainer
+
+
+def test_archive_round_trip(trainer, tmp_path):
+    path = str(tmp_path / 'snakes.snk')
+    genomes = trainer.population.individuals[:5]
+    for i, genome in enumerate(genomes):
+        save_snake_to_archive(path, 'snake{}'.format(i), genome, trainer.settings, generation=i)
+    # Saving a name again replaces it
+    save_snake_to_archive(path, 'snake0', genomes[-1], trainer.settings, generation=0)
+    expected = dict(('snake{}'.format(i), genome) for i, genome in enumerate(genomes))
+    expected['snake0'] = genomes[-1]
+
+    settings, index = load_archive_index(path)
+    assert sorted(index) == sorted(expected)
+    assert settings['hidden_network_architecture'] == trainer.settings['hidden_network_architecture']
+
+    for name, genome in expected.items():
+        loaded = load_snake(path, name)
+        assert np.array_equal(loaded.chromosome, genome.chromosome)
+        assert play_to_death(loaded) == play_to_death(trainer.create_snake(genome, detect_loops=False))
+    # A generation number loads the latest snake saved for it
+    assert np.array_equal(load_snake(path, 0).chromosome, genomes[-1].chromosome)
+
+
+def test_archive_matches_save_snake(trainer, tmp_path):
+    genome = trainer.population.individuals[0]
+    save_snake(str(tmp_path / 'population'), 'best', trainer.create_snake(genome), trainer.settings)
+    save_snake_to_archive(str(tmp_path / 'snakes.snk'), 'best', genome, trainer.settings)
+    from_folder = load_snake(str(tmp_path / 'population'), 'best')
+    from_archive = load_snake(str(tmp_path / 'snakes.snk'), 'best')
+    assert np.array_equal(from_folder.chromosome, from_archive.chromosome)
+    assert play_to_death(from_folder) == play_to_death(from_archive)
+
+
+def test_unfinished_archive_is_not_overwritten(trainer, tmp_path):
+    path = tmp_path / 'snakes.snk'
+    # What a crash between creating the file and writing its header used to leave behind
+    path.write_bytes(ARCHIVE_MAGIC + bytes(8))
+    with pytest.raises(Exception):
+        save_snake_to_archive(str(path), 'best', trainer.population.individuals[0], trainer.settings)
+    assert path.read_bytes() == ARCHIVE_MAGIC + bytes(8)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from stats import StatsWriter, load_stats, load_distributions
+from trainer import Trainer
+
+
+def write_generations(writer, trainer, num_generations):
+    for _ in range(num_generations):
+        trainer.evaluate_population()
+        writer.add_generation(trainer.current_generation, trainer.population)
+        trainer.next_generation()
+    writer.close()
+
+
+def test_resumed_stats_carry_on_from_the_checkpoint(settings, tmp_path):
+    folder = str(tmp_path / 'stats')
+    checkpoint = str(tmp_path / 'run.npz')
+    uninterrupted = str(tmp_path / 'uninterrupted')
+    write_generations(StatsWriter(uninterrupted, distributions=True), Trainer(settings, seed=3), 4)
+
+    trainer = Trainer(settings, seed=3)
+    write_generations(StatsWriter(folder, distributions=True), trainer, 2)
+    trainer.save_checkpoint(checkpoint)
+    # The run got two more generations in before it was stopped, without another checkpoint
+    write_generations(StatsWriter(folder, distributions=True, start_generation=2), trainer, 2)
+
+    with pytest.raises(Exception):
+        StatsWriter(folder, distributions=True)
+    resumed = Trainer.from_checkpoint(checkpoint)
+    write_generations(StatsWriter(folder, distributions=True, start_generation=resumed.current_generation), resumed, 2)
+
+    stats, expected = load_stats(folder, normalize=False), load_stats(uninterrupted, normalize=False)
+    assert stats['generation'].tolist() == [0, 1, 2, 3]
+    assert np.array_equal(stats['fitness']['mean'], expected['fitness']['mean'])
+    distributions, expected = load_distributions(folder), load_distributions(uninterrupted)
+    assert np.array_equal(distributions['offsets'], expected['offsets'])
+    assert np.array_equal(distributions['fitness'], expected['fitness'])
@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pytest
+
+from snake import save_snake, load_snake
+from trainer import Trainer
+
+
+def play_generations(settings, num_generations, **kwargs):
+    """
+    Results of every individual, for every generation of a seeded run.
+    """
+    trainer = Trainer(settings, seed=7, **kwargs)
+    generations = []
+    try:
+        for _ in range(num_generations):
+            trainer.evaluate_population()
+            generations.append([(individual.score, individual._frames, individual.fitness, individual.death_cause)
+                                for individual in trainer.population.individuals])
+            trainer.next_generation()
+    finally:
+        trainer.close()
+    return generations
+
+
+def test_process_pool_matches_serial(settings):
+    assert play_generations(settings, 3, num_workers=2) == play_generations(settings, 3)
+
+
+def test_batch_matches_serial(settings):
+    assert play_generations(settings, 3, batch=True) == play_generations(settings, 3)
+
+
+def test_seed_reproduces_populations(settings):
+    populations = []
+    for seed in (3, 3, 4):
+        trainer = Trainer(settings, seed=seed)
+        for _ in range(2):
+            trainer.evaluate_population()
+            trainer.next_generation()
+        populations.append(trainer.population.chromosomes)
+    assert np.array_equal(populations[0], populations[1])
+    assert not np.array_equal(populations[0], populations[2])
+
+
+def test_checkpoint_resumes_the_same_run(settings, tmp_path):
+    path = str(tmp_path / 'run.npz')
+    uninterrupted = Trainer(settings, seed=5)
+    interrupted = Trainer(settings, seed=5)
+    for trainer in (uninterrupted, interrupted):
+        for _ in range(2):
+            trainer.evaluate_population()
+            trainer.next_generation()
+    interrupted.save_checkpoint(path)
+    resumed = Trainer.from_checkpoint(path)
+    assert not os.path.exists(path + '.tmp')
+
+    for trainer in (uninterrupted, resumed):
+        for _ in range(2):
+            trainer.evaluate_population()
+            trainer.next_generation()
+        trainer.evaluate_population()
+    assert resumed.current_generation == uninterrupted.current_generation
+    assert np.array_equal(resumed.population.chromosomes, uninterrupted.population.chromosomes)
+    assert [individual.fitness for individual in resumed.population.individuals] == \
+           [individual.fitness for individual in uninterrupted.population.individuals]
+    assert (resumed.best_fitness, resumed.best_score) == (uninterrupted.best_fitness, uninterrupted.best_score)
+
+
+def play_results(settings, genomes, **kwargs):
+    trainer = Trainer(settings, seed=1, **kwargs)
+    try:
+        trainer.play_genomes(genomes)
+    finally:
+        trainer.close()
+    return [(genome.score, genome._frames, genome.death_cause) for genome in genomes]
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'batch': True}, {'num_workers': 2}])
+def test_loop_detection_gives_the_same_results(chaser_settings, make_genomes, kwargs):
+    expected = play_results(chaser_settings, make_genomes())
+    assert any(death_cause == 'starvation' for _, _, death_cause in expected)
+    chaser_settings['detect_loops'] = True
+    assert play_results(chaser_settings, make_genomes(), **kwargs) == expected
+
+
+def test_missing_starvation_limit_is_the_original_100(settings, tmp_path):
+    settings['board_size'] = (30, 30)
+    del settings['starvation_limit']
+    del settings['scale_starvation_limit']
+    trainer = Trainer(settings, seed=1)
+    save_snake(str(tmp_path), 'snake', trainer.create_snake(trainer.population.individuals[0]), settings)
+    assert load_snake(str(tmp_path), 'snake').starvation_limit == 100
+
+    settings['scale_starvation_limit'] = True
+    assert Trainer(settings, seed=1).create_snake(trainer.population.individuals[0]).starvation_limit == 900
+
+
+@pytest.mark.parametrize('kwargs', [{'batch': True}, {'num_workers': 2}])
+@pytest.mark.parametrize('adaptive', [False, True])
+def test_episodes_match_serial(settings, kwargs, adaptive):
+    settings.update({'num_episodes': 3, 'episode_aggregation': 'min', 'adaptive_episodes': adaptive})
+    assert play_generations(settings, 3, **kwargs) == play_generations(settings, 3)
+
+
+def test_adaptive_band_is_only_ranked_against_itself(settings):
+    settings.update({'num_episodes': 4, 'episode_aggregation': 'min',
+                     'adaptive_episodes': True, 'adaptive_episode_band': 0.2})
+    trainer = Trainer(settings, seed=5)
+    trainer.evaluate_population()
+    trainer.next_generation()
+    trainer.evaluate_population()
+
+    ranked = trainer.ranked_individuals()
+    band = [i for i, individual in enumerate(ranked) if individual.episode_results]
+    assert band == list(range(band[0], band[-1] + 1))
+    assert band[0] < settings['num_parents'] < band[-1]
+    # Everyone else is still in fitness order around the band, and the band is in fitness order within itself
+    for section in (ranked[:band[0]], ranked[band[0]:band[-1] + 1], ranked[band[-1] + 1:]):
+        fitnesses = [individual.fitness for individual in section]
+        assert fitnesses == sorted(fitnesses, reverse=True)
+
+    # With 'plus' selection the survivors are carried over into the next generation as they are
+    survivors = set(individual.chromosome.tobytes() for individual in ranked[:settings['num_parents']])
+    trainer.next_generation()
+    carried_over = [individual for individual in trainer.population.individuals
+                    if individual.chromosome.tobytes() in survivors]
+    assert len(carried_over) == settings['num_parents']
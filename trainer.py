@@ -0,0 +1,731 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from math import sqrt
+from typing import List, Tuple, Optional, Dict, Any
+import numpy as np
+
+from misc import Point, get_vision_by_num, get_starvation_limit_from_settings, DEATH_CAUSES
+from snake import Snake, SnakeGenome, save_snake_to_archive, snake_fitness, EPISODE_AGGREGATIONS
+from compiled_game import CompiledGame, HAVE_NUMBA
+from batch_env import BatchSnakeEnv, play_batch
+from replay import Replay, record_replay
+from stats import StatsWriter
+from shared_population import SharedPopulation, POSSIBLE_DIRECTIONS
+from neural_network import BatchFeedForwardNetwork, get_activation_by_name, random_chromosome
+from genetic_algorithm.population import Population
+from genetic_algorithm.selection import elitism_selection, roulette_wheel_selection, stochastic_universal_sampling, tournament_selection
+from genetic_algorithm.mutation import batch_gaussian_mutation, batch_random_uniform_mutation
+from genetic_algorithm.crossover import batch_simulated_binary_crossover as batch_SBX
+from genetic_algorithm.crossover import batch_single_point_binary_crossover
+
+
+# First spawn key of the SeedSequence that extra episodes are drawn from. Generation streams use
+# spawn_key=(generation, individual), so this keeps the two from ever overlapping
+_EPISODE_SPAWN_KEY = 2**32
+
+# Settings for the current worker process. Set once by the pool initializer so they
+# don't have to be pickled with every individual.
+_worker_settings: Optional[Dict[str, Any]] = None
+# Shared population the worker is attached to. Kept between jobs and only reattached when the trainer makes a new one
+_worker_population: Optional[SharedPopulation] = None
+# Compiled game for the worker's settings, if numba is installed
+_worker_game: Optional[CompiledGame] = None
+
+def _init_worker(settings: Dict[str, Any]) -> None:
+    global _worker_settings, _worker_game
+    _worker_settings = settings
+    _worker_game = create_compiled_game(settings)
+
+def create_compiled_game(settings: Dict[str, Any]) -> Optional[CompiledGame]:
+    """
+    A CompiledGame for settings if numba is installed and settings['use_numba'] is turned on, otherwise None.
+    """
+    if HAVE_NUMBA and settings.get('use_numba', False):
+        return CompiledGame.from_settings(settings)
+    return None
+
+def _evaluate_in_worker(job: Tuple[int, int, Tuple[str, str, str], int, int]) -> int:
+    """
+    Play rows [start, end) of the shared population and write their results back into it.
+    """
+    global _worker_population
+    capacity, num_genes, names, start, end = job
+    if _worker_population is None or _worker_population.names != names:
+        if _worker_population is not None:
+            _worker_population.close()
+        _worker_population = SharedPopulation.attach(capacity, num_genes, names)
+
+    population = _worker_population
+    for i in range(start, end):
+        x, y, apple_seed, direction = population.games[i].tolist()
+        if _worker_game is not None:
+            score, frames, death_cause = _worker_game.play(population.chromosomes[i], Point(x, y),
+                                                           apple_seed, POSSIBLE_DIRECTIONS[direction])
+            fitness = snake_fitness(frames, score)
+        else:
+            score, frames, fitness, death_cause = evaluate_snake(_worker_settings, population.chromosomes[i], (x, y),
+                                                                 apple_seed, POSSIBLE_DIRECTIONS[direction])
+        population.results[i] = (score, frames, fitness, DEATH_CAUSES.index(death_cause) if death_cause else -1)
+    return end - start
+
+def evaluate_snake(settings: Dict[str, Any], chromosome: np.ndarray,
+                   start_pos: Tuple[int, int], apple_seed: int, starting_direction: str) -> Tuple[int, int, float, str]:
+    """
+    Rebuild a snake from its chromosome and replay information, run it until it dies
+    and return (score, frames, fitness, death_cause).
+    Since everything random about a game is fixed by start_pos, apple_seed and starting_direction,
+    this gives the same result no matter which process it runs in.
+    """
+    snake = Snake(tuple(settings['board_size']), chromosome=chromosome,
+                  start_pos=Point(start_pos[0], start_pos[1]),
+                  apple_seed=apple_seed,
+                  starting_direction=starting_direction,
+                  hidden_layer_architecture=settings['hidden_network_architecture'],
+                  hidden_activation=settings['hidden_layer_activation'],
+                  output_activation=settings['output_layer_activation'],
+                  apple_and_self_vision=settings['apple_and_self_vision'],
+                  vision_type=settings['vision_type'],
+                  starvation_limit=get_starvation_limit_from_settings(settings),
+                  detect_loops=settings.get('detect_loops', True),
+                  incremental_vision=settings.get('incremental_vision', False))
+    Trainer.play(snake)
+    snake.calculate_fitness()
+    return snake.score, snake._frames, snake.fitness, snake.death_cause
+
+
+class Trainer(object):
+    """
+    Headless GA training loop.
+    Runs every snake in the population to death in a tight loop (no Qt, no timer, no repaint),
+    then creates the next generation from settings. This is the same logic MainWindow uses.
+
+    The population is made of SnakeGenome, not Snake. A Snake (network, body, apple, ...) is only
+    built for a genome when it is played, and the batch mode doesn't build one at all.
+
+    If num_workers > 1, individuals are evaluated in a process pool. The chromosomes and the replay information
+    (start_pos, apple_seed, starting_direction) are copied into a SharedPopulation, and workers write score,
+    frames, fitness and death cause back into it. A job is only a range of rows, so nothing about the network
+    is pickled and the results are identical to a serial evaluation.
+
+    If batch is True, the whole population is played at once in a BatchSnakeEnv with a
+    BatchFeedForwardNetwork. This also gives the same results as a serial evaluation.
+
+    If settings['use_numba'] is True and numba is installed, games are played by a CompiledGame instead of a
+    Snake, both serially and in the workers. It gives the same results as Snake, just faster, except in the
+    rare game where two network outputs are within a rounding error of each other (see CompiledGame). So with
+    it on, a seed isn't guaranteed to give the same run as with batch, or on a machine without numba.
+
+    If settings['num_episodes'] > 1, every genome also plays num_episodes - 1 extra games, and its fitness is
+    the settings['episode_aggregation'] ('mean' or 'min') over all of them, so a lucky apple doesn't decide
+    who survives. Every genome of a generation plays the same extra games (start position, apple seed and
+    direction), so they are compared on the same boards. The extra games go through the same serial, process
+    pool or batch path as everything else, all at once.
+    With settings['adaptive_episodes'], the extra games are only played by the genomes ranked within
+    settings['adaptive_episode_band'] (a fraction of the population) of the elitism cutoff, since those are the
+    only ones where a bit of luck can change who survives. Everyone else keeps their single game fitness.
+    The band is then only ranked against itself: everyone above it survives, everyone below it doesn't, and
+    the survivor slots left over go to the best of the band (see ranked_individuals). Otherwise a 'min'
+    aggregation, which can only go down with more games, would push the band below snakes that were never retested.
+
+    All randomness comes from seed (or settings['seed'], or fresh entropy if neither is set).
+    Generation g gets its own SeedSequence(seed, spawn_key=(g,)), which is spawned into one stream for
+    the GA operators and one stream per individual of that generation. Since the streams only depend on
+    the seed and the generation number, the same seed gives the same populations whether the snakes are
+    played serially, in a process pool or in a batch.
+
+    save_checkpoint writes everything needed to continue the run to a single .npz file, and
+    Trainer.from_checkpoint picks the run back up exactly where it stopped.
+    """
+    def __init__(self, settings: Dict[str, Any], num_workers: Optional[int] = None, batch: Optional[bool] = False,
+                 seed: Optional[int] = None, population: Optional[Population] = None):
+        self.settings = settings
+        self.num_workers = num_workers
+        self.batch = batch
+        if seed is None:
+            seed = self.settings.get('seed', None)
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._shared_population: Optional[SharedPopulation] = None
+        self._compiled_game = create_compiled_game(self.settings)
+        self._SBX_eta = self.settings['SBX_eta']
+        self._mutation_bins = np.cumsum([self.settings['probability_gaussian'],
+                                        self.settings['probability_random_uniform']
+        ])
+        self._crossover_bins = np.cumsum([self.settings['probability_SBX'],
+                                         self.settings['probability_SPBX']
+        ])
+        self._SPBX_type = self.settings['SPBX_type'].lower()
+        self._mutation_rate = self.settings['mutation_rate']
+
+        # Determine size of next gen based off selection type
+        self._next_gen_size = None
+        if self.settings['selection_type'].lower() == 'plus':
+            self._next_gen_size = self.settings['num_parents'] + self.settings['num_offspring']
+        elif self.settings['selection_type'].lower() == 'comma':
+            self._next_gen_size = self.settings['num_offspring']
+        else:
+            raise Exception('Selection type "{}" is invalid'.format(self.settings['selection_type']))
+
+        self.board_size = tuple(self.settings['board_size'])
+        self._starvation_limit = get_starvation_limit_from_settings(self.settings)
+        self._detect_loops = self.settings.get('detect_loops', True)
+        self._num_episodes = self.settings.get('num_episodes', 1)
+        self._episode_aggregation = self.settings.get('episode_aggregation', 'mean').lower()
+        if self._episode_aggregation not in EPISODE_AGGREGATIONS:
+            raise Exception('Episode aggregation "{}" is invalid'.format(self.settings['episode_aggregation']))
+        self._adaptive_episodes = self.settings.get('adaptive_episodes', False)
+        self._adaptive_episode_band = self.settings.get('adaptive_episode_band', 0.1)
+        self._vision_type = get_vision_by_num(self.settings['vision_type'])
+        # Same architecture as Snake: 3 inputs per vision line plus the one-hot direction and tail direction
+        self._network_architecture = [len(self._vision_type) * 3 + 4 + 4]
+        self._network_architecture.extend(self.settings['hidden_network_architecture'])
+        self._network_architecture.append(4)
+
+        self.best_fitness = 0
+        self.best_score = 0
+        self.current_generation = 0
+        # Survival order of the evaluated population if it isn't just by fitness (adaptive episodes)
+        self._ranking: Optional[List[SnakeGenome]] = None
+
+        # Start from a random population unless one is given
+        if population is None:
+            _, individual_rngs = self._generation_rngs(self.current_generation, self.settings['num_parents'])
+            individuals: List[SnakeGenome] = []
+            for rng in individual_rngs:
+                individuals.append(self._create_genome(rng))
+            population = Population(individuals)
+
+        self.population = population
+
+    def save_checkpoint(self, path: str) -> None:
+        """
+        Save the run to a single .npz file: every genome (chromosome, lifespan and replay information),
+        the generation counter, best fitness/score, settings and seed.
+        Nothing else needs saving for the RNG since every stream is derived from the seed and the generation.
+        The file is written next to path first and then moved over it, so a crash never leaves a partial checkpoint.
+        """
+        individuals = self.population.individuals
+        state = {
+            'generation': self.current_generation,
+            'best_fitness': self.best_fitness,
+            'best_score': self.best_score,
+            # Seeds from entropy don't fit in an int64, so keep it as a string
+            'seed': str(self.seed),
+            'settings': self.settings
+        }
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            np.savez(fp,
+                     state=np.array(json.dumps(state)),
+                     chromosomes=self.population.chromosomes,
+                     lifespans=np.array([individual.lifespan for individual in individuals], dtype=np.float64),
+                     start_positions=np.array([(individual.start_pos.x, individual.start_pos.y) for individual in individuals], dtype=np.int64),
+                     apple_seeds=np.array([individual.apple_seed for individual in individuals], dtype=np.int64),
+                     starting_directions=np.array([individual.starting_direction for individual in individuals]))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_checkpoint(cls, path: str, num_workers: Optional[int] = None, batch: Optional[bool] = False) -> 'Trainer':
+        """
+        Continue a run saved with save_checkpoint.
+        """
+        with np.load(path) as checkpoint:
+            state = json.loads(str(checkpoint['state']))
+            chromosomes = checkpoint['chromosomes']
+            lifespans = checkpoint['lifespans']
+            start_positions = checkpoint['start_positions']
+            apple_seeds = checkpoint['apple_seeds']
+            starting_directions = checkpoint['starting_directions']
+
+        settings = state['settings']
+        board_size = tuple(settings['board_size'])
+        individuals = [SnakeGenome(board_size, chromosomes[i],
+                                   start_pos=Point(int(start_positions[i, 0]), int(start_positions[i, 1])),
+                                   apple_seed=int(apple_seeds[i]),
+                                   starting_direction=str(starting_directions[i]),
+                                   lifespan=float(lifespans[i]))
+                       for i in range(chromosomes.shape[0])]
+
+        trainer = cls(settings, num_workers=num_workers, batch=batch,
+                      seed=int(state['seed']), population=Population(individuals))
+        trainer.current_generation = state['generation']
+        trainer.best_fitness = state['best_fitness']
+        trainer.best_score = state['best_score']
+        return trainer
+
+    def _generation_rngs(self, generation: int, num_individuals: int) -> Tuple[np.random.Generator, List[np.random.Generator]]:
+        """
+        Returns the GA operator stream and a stream for each individual of a generation.
+        """
+        seed_sequence = np.random.SeedSequence(self.seed, spawn_key=(generation,))
+        children = seed_sequence.spawn(num_individuals + 1)
+        return np.random.default_rng(children[0]), [np.random.default_rng(child) for child in children[1:]]
+
+    def _episodes(self, generation: int) -> List[SnakeGenome]:
+        """
+        The extra games every genome of a generation plays, as genomes without a chromosome.
+        Only start_pos, apple_seed and starting_direction are used.
+        """
+        seed_sequence = np.random.SeedSequence(self.seed, spawn_key=(_EPISODE_SPAWN_KEY, generation))
+        rng = np.random.default_rng(seed_sequence)
+        return [SnakeGenome(self.board_size, None, rng=rng) for _ in range(self._num_episodes - 1)]
+
+    def _create_genome(self, rng: np.random.Generator, chromosome: Optional[np.ndarray] = None,
+                       lifespan: Optional[float] = None) -> SnakeGenome:
+        if chromosome is None:
+            chromosome = random_chromosome(self._network_architecture, rng)
+        if lifespan is None:
+            lifespan = self.settings['lifespan']
+        return SnakeGenome(self.board_size, chromosome, lifespan=lifespan, rng=rng)
+
+    def create_snake(self, genome: SnakeGenome, detect_loops: Optional[bool] = None) -> Snake:
+        """
+        Build a playable Snake from a genome. The network uses the genome's chromosome directly.
+        detect_loops defaults to settings['detect_loops']. Turn it off to watch (or record) the whole game.
+        """
+        if detect_loops is None:
+            detect_loops = self._detect_loops
+        return Snake(self.board_size, chromosome=genome.chromosome,
+                     start_pos=genome.start_pos,
+                     apple_seed=genome.apple_seed,
+                     starting_direction=genome.starting_direction,
+                     hidden_layer_architecture=self.settings['hidden_network_architecture'],
+                     hidden_activation=self.settings['hidden_layer_activation'],
+                     output_activation=self.settings['output_layer_activation'],
+                     lifespan=genome.lifespan,
+                     apple_and_self_vision=self.settings['apple_and_self_vision'],
+                     vision_type=self.settings['vision_type'],
+                     starvation_limit=self._starvation_limit,
+                     detect_loops=detect_loops,
+                     incremental_vision=self.settings.get('incremental_vision', False))
+
+    def replay_genome(self, genome: SnakeGenome) -> Replay:
+        """
+        Record a replay of the game an evaluated genome played.
+        Nothing is recorded during evaluation, since only the best games are worth keeping and they aren't known until
+        everyone has played. The game is played again with Snake instead, which is the game the serial, pool and batch
+        evaluations play too. The compiled game can turn differently on a near tie, so this refuses to run with it,
+        and a replay that doesn't end with the genome's score and frames raises.
+        """
+        if self._compiled_game is not None:
+            raise Exception("Replays are recorded by playing the game again with Snake, which can differ from the "
+                            "compiled game. Turn off 'use_numba' to record them")
+        replay = record_replay(self.create_snake(genome, detect_loops=False))
+        if (replay.score, replay.frames) != (genome.score, genome._frames):
+            raise Exception('Replay ended with score {} after {} frames, but the evaluated game ended with score {} after {} frames'.format(
+                replay.score, replay.frames, genome.score, genome._frames))
+        return replay
+
+    @staticmethod
+    def play(snake: Snake) -> None:
+        """
+        Run a single snake until it dies.
+        This mirrors the order MainWindow steps a snake in: look/think, then move.
+        """
+        while snake.is_alive:
+            snake.update()
+            snake.move()
+
+    def evaluate_population(self) -> None:
+        """
+        Play every individual in the population (over several episodes if settings['num_episodes'] > 1)
+        and calculate its fitness.
+        """
+        individuals = self.population.individuals
+        self._ranking = None
+        for individual in individuals:
+            individual.episode_results = None
+            individual.episode_aggregation = self._episode_aggregation
+
+        if self._num_episodes <= 1:
+            self.play_genomes(individuals)
+        elif not self._adaptive_episodes:
+            # Play everything at once so the batch and the process pool get as much work as possible
+            episode_genomes = self._episode_genomes(individuals)
+            self.play_genomes(individuals + episode_genomes)
+            self._set_episode_results(individuals, episode_genomes)
+        else:
+            self.play_genomes(individuals)
+            for individual in individuals:
+                individual.calculate_fitness()
+            ranked = self.ranked_individuals()
+            start, end = self._cutoff_band(len(ranked))
+            candidates = ranked[start:end]
+            episode_genomes = self._episode_genomes(candidates)
+            self.play_genomes(episode_genomes)
+            self._set_episode_results(candidates, episode_genomes)
+            for individual in candidates:
+                individual.calculate_fitness()
+            # The band only competes with itself. Everyone above it stays above and everyone below stays below
+            band = sorted(candidates, key=lambda individual: individual.fitness, reverse=True)
+            self._ranking = ranked[:start] + band + ranked[end:]
+
+        for individual in individuals:
+            individual.calculate_fitness()
+            if individual.score > self.best_score:
+                self.best_score = individual.score
+            if individual.fitness > self.best_fitness:
+                self.best_fitness = individual.fitness
+
+    def _episode_genomes(self, individuals: List[SnakeGenome]) -> List[SnakeGenome]:
+        """
+        A genome for every (individual, extra episode) pair, ordered by individual.
+        They share the individual's chromosome, so no weights are copied.
+        """
+        episodes = self._episodes(self.current_generation)
+        return [SnakeGenome(self.board_size, individual.chromosome,
+                            start_pos=episode.start_pos,
+                            apple_seed=episode.apple_seed,
+                            starting_direction=episode.starting_direction)
+                for individual in individuals for episode in episodes]
+
+    def _set_episode_results(self, individuals: List[SnakeGenome], episode_genomes: List[SnakeGenome]) -> None:
+        num_extra = self._num_episodes - 1
+        for i, individual in enumerate(individuals):
+            individual.episode_results = [(genome.score, genome._frames)
+                                          for genome in episode_genomes[i * num_extra:(i + 1) * num_extra]]
+
+    def _cutoff_band(self, num_individuals: int) -> Tuple[int, int]:
+        """
+        Start and end of the ranks close enough to the elitism cutoff that more episodes could change who survives.
+        """
+        cutoff = self.settings['num_parents']
+        # Everyone survives, so there's nothing to decide
+        if num_individuals <= cutoff:
+            return 0, 0
+        band = max(1, int(round(self._adaptive_episode_band * num_individuals)))
+        return max(0, cutoff - band), cutoff + band
+
+    def ranked_individuals(self) -> List[SnakeGenome]:
+        """
+        The evaluated population from best to worst, in the order elitism picks survivors.
+        That's by fitness (same order as elitism_selection), except with adaptive episodes where the band around
+        the cutoff is ranked among itself.
+        """
+        if self._ranking is not None:
+            return list(self._ranking)
+        return elitism_selection(self.population, len(self.population.individuals))
+
+    def set_ranking(self, ranked: Optional[List[SnakeGenome]]) -> None:
+        """
+        Replace the survival order, i.e. after individuals were swapped in or out of the evaluated population.
+        """
+        self._ranking = list(ranked) if ranked is not None else None
+
+    def play_genomes(self, genomes: List[SnakeGenome]) -> None:
+        """
+        Play every genome once and set its score, frames and death cause.
+        Uses the batch, the process pool or a plain loop depending on how the trainer was created.
+        """
+        if not genomes:
+            return
+        if self.batch:
+            self._play_batch(genomes)
+        elif self.num_workers and self.num_workers > 1:
+            self._play_parallel(genomes)
+        elif self._compiled_game is not None:
+            for genome in genomes:
+                genome.score, genome._frames, genome.death_cause = self._compiled_game.play(
+                    genome.chromosome, genome.start_pos, genome.apple_seed, genome.starting_direction)
+        else:
+            for genome in genomes:
+                snake = self.create_snake(genome)
+                self.play(snake)
+                genome.score = snake.score
+                genome._frames = snake._frames
+                genome.death_cause = snake.death_cause
+
+    def _play_parallel(self, genomes: List[SnakeGenome]) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                                 initializer=_init_worker,
+                                                 initargs=(self.settings,))
+
+        # Only grows, so it's made once for the biggest population (or population plus episodes) seen
+        num_genes = genomes[0].chromosome.shape[-1]
+        shared = self._shared_population
+        if shared is None or shared.capacity < len(genomes) or shared.num_genes != num_genes:
+            if shared is not None:
+                shared.unlink()
+            shared = self._shared_population = SharedPopulation(len(genomes), num_genes)
+        shared.write_genomes(genomes)
+
+        # A few chunks per worker keeps IPC overhead low while still balancing long and short games
+        chunksize = max(1, len(genomes) // (self.num_workers * 4))
+        jobs = [(shared.capacity, num_genes, shared.names, start, min(start + chunksize, len(genomes)))
+                for start in range(0, len(genomes), chunksize)]
+        for _ in self._executor.map(_evaluate_in_worker, jobs):
+            pass
+        shared.read_results(genomes)
+
+    def _play_batch(self, genomes: List[SnakeGenome]) -> None:
+        env = BatchSnakeEnv.from_genomes(genomes, self.board_size,
+                                         vision_type=self._vision_type,
+                                         apple_and_self_vision=self.settings['apple_and_self_vision'],
+                                         starvation_limit=self._starvation_limit,
+                                         detect_loops=self._detect_loops)
+        network = BatchFeedForwardNetwork.from_chromosomes(self._network_architecture,
+                                                           get_activation_by_name(self.settings['hidden_layer_activation']),
+                                                           get_activation_by_name(self.settings['output_layer_activation']),
+                                                           np.stack([genome.chromosome for genome in genomes]))
+        play_batch(env, network)
+
+        for n, genome in enumerate(genomes):
+            genome.score = int(env.score[n])
+            genome._frames = int(env.frames[n])
+            genome.death_cause = DEATH_CAUSES[env.death_cause[n]]
+
+    def close(self) -> None:
+        """
+        Shut down the worker pool and free the shared population if there is one.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._shared_population is not None:
+            self._shared_population.unlink()
+            self._shared_population = None
+
+    def run_generation(self) -> None:
+        """
+        Evaluate the current generation and then create the next one.
+        """
+        self.evaluate_population()
+        self.next_generation()
+
+    def next_generation(self) -> None:
+        self.current_generation += 1
+
+        # Calculate fitness of individuals
+        for individual in self.population.individuals:
+            individual.calculate_fitness()
+
+        self.population.individuals = self.ranked_individuals()[:self.settings['num_parents']]
+        self._ranking = None
+
+        rng, individual_rngs = self._generation_rngs(self.current_generation, self._next_gen_size + 1)
+        rng.shuffle(self.population.individuals)
+        next_pop: List[SnakeGenome] = []
+
+        # parents + offspring selection type ('plus')
+        if self.settings['selection_type'].lower() == 'plus':
+            # Decrement lifespan
+            for individual in self.population.individuals:
+                individual.lifespan -= 1
+
+            for individual in self.population.individuals:
+                # If the individual is still alive, they survive
+                if individual.lifespan > 0:
+                    next_pop.append(self._create_genome(individual_rngs[len(next_pop)], chromosome=individual.chromosome, lifespan=individual.lifespan))
+
+        # Offspring are made two at a time, so there may be one extra if the number needed is odd
+        num_pairs = (self._next_gen_size - len(next_pop) + 1) // 2
+        if num_pairs > 0:
+            parents = self._select_parents(2 * num_pairs, rng)
+            parents1 = np.stack([p1.chromosome for p1 in parents[0::2]])
+            parents2 = np.stack([p2.chromosome for p2 in parents[1::2]])
+
+            # Every pair is crossed over and mutated at once. Rows (2i, 2i+1) are the children of pair i
+            children = self._crossover(parents1, parents2, rng)
+            self._mutation(children, rng)
+
+            # Clip to [-1, 1]
+            np.clip(children, -1, 1, out=children)
+
+            # Create children from chromosomes generated above. Each one is a row view into children
+            for chromosome in children:
+                next_pop.append(self._create_genome(individual_rngs[len(next_pop)], chromosome=chromosome))
+
+        # Set the next generation
+        rng.shuffle(next_pop)
+        self.population.individuals = next_pop
+
+    def _select_parents(self, num_parents: int, rng: np.random.Generator) -> List[SnakeGenome]:
+        """
+        Select every parent needed for this generation at once.
+        """
+        selection_type = self.settings['crossover_selection_type'].lower()
+        if selection_type == 'roulette_wheel':
+            return roulette_wheel_selection(self.population, num_parents, rng)
+        elif selection_type == 'stochastic_universal_sampling':
+            parents = stochastic_universal_sampling(self.population, num_parents, rng)
+            # SUS returns parents in wheel order, so shuffle them to get random pairs
+            rng.shuffle(parents)
+            return parents
+        elif selection_type == 'tournament':
+            return tournament_selection(self.population, num_parents, self.settings.get('tournament_size', 3), rng)
+        else:
+            raise Exception('Crossover selection type "{}" is invalid'.format(self.settings['crossover_selection_type']))
+
+    def _crossover(self, parents1: np.ndarray, parents2: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Cross over every pair of parents, given as (num_pairs, num_genes) matrices.
+        Returns a (2 * num_pairs, num_genes) matrix where rows 2i and 2i+1 are the children of pair i.
+        """
+        num_pairs = parents1.shape[0]
+        crossover_buckets = np.digitize(rng.random(num_pairs), self._crossover_bins)
+        if np.any(crossover_buckets > 1):
+            raise Exception('Unable to determine valid crossover based off probabilities')
+
+        children = np.empty((2 * num_pairs, parents1.shape[1]))
+
+        # SBX
+        rows = np.flatnonzero(crossover_buckets == 0)
+        if rows.size:
+            children[2 * rows], children[2 * rows + 1] = batch_SBX(parents1[rows], parents2[rows], self._SBX_eta, rng)
+
+        # Single point binary crossover (SPBX)
+        # @NOTE: The chromosome is already flat, so SPBX_type doesn't matter here
+        rows = np.flatnonzero(crossover_buckets == 1)
+        if rows.size:
+            children[2 * rows], children[2 * rows + 1] = batch_single_point_binary_crossover(parents1[rows], parents2[rows], rng)
+
+        return children
+
+    def _mutation(self, children: np.ndarray, rng: np.random.Generator) -> None:
+        """
+        Mutate children in place. Both children of a pair get the same type of mutation.
+        """
+        scale = .2
+        num_pairs = children.shape[0] // 2
+        mutation_buckets = np.repeat(np.digitize(rng.random(num_pairs), self._mutation_bins), 2)
+        if np.any(mutation_buckets > 1):
+            raise Exception('Unable to determine valid mutation based off probabilities.')
+
+        mutation_rate = self._mutation_rate
+        if self.settings['mutation_rate_type'].lower() == 'decaying':
+            mutation_rate = mutation_rate / sqrt(self.current_generation + 1)
+
+        # Gaussian
+        rows = np.flatnonzero(mutation_buckets == 0)
+        if rows.size:
+            mutated = children[rows]
+            batch_gaussian_mutation(mutated, mutation_rate, scale=scale, rng=rng)
+            children[rows] = mutated
+
+        # Uniform random
+        rows = np.flatnonzero(mutation_buckets == 1)
+        if rows.size:
+            mutated = children[rows]
+            batch_random_uniform_mutation(mutated, mutation_rate, -1, 1, rng)
+            children[rows] = mutated
+
+
+def load_settings(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Load settings from a JSON file (such as the settings.json written by save_snake),
+    or fall back to settings.py if no path is given.
+    """
+    if not path:
+        from settings import settings
+        return settings
+
+    with open(path, 'r', encoding='utf-8') as fp:
+        return json.load(fp)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Train snakes without the GUI.')
+    parser.add_argument('--settings', type=str, default=None,
+                        help='Path to a settings JSON file. Defaults to settings.py')
+    parser.add_argument('--generations', type=int, default=None,
+                        help='Number of generations to run. Runs forever if not set')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to evaluate the population. 0 uses every core')
+    parser.add_argument('--batch', action='store_true',
+                        help='Play the whole population at once on NumPy arrays instead of one snake at a time')
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for the run. Defaults to settings['seed'], or a random seed if that isn't set")
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='Path of the .npz file to save the run to')
+    parser.add_argument('--checkpoint-every', type=int, default=1,
+                        help='Save a checkpoint every N generations')
+    parser.add_argument('--archive', type=str, default=None,
+                        help='Snake archive to save the best snake of every generation to')
+    parser.add_argument('--replays', type=str, default=None,
+                        help='Folder to save a replay of the best snake of every generation to')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Write timings and counters for every generation to this file as JSON lines')
+    parser.add_argument('--stats', type=str, default=None,
+                        help='Folder to write per-generation stats to')
+    parser.add_argument('--stats-distributions', action='store_true',
+                        help="Also write every individual's steps, apples, fitness and death cause to --stats")
+    parser.add_argument('--resume', type=str, default=None,
+                        help='Continue the run saved in this checkpoint. --settings and --seed are ignored')
+    args = parser.parse_args(argv)
+
+    num_workers = args.workers if args.workers > 0 else os.cpu_count()
+    if args.resume:
+        trainer = Trainer.from_checkpoint(args.resume, num_workers=num_workers, batch=args.batch)
+        print('Resuming from generation {}'.format(trainer.current_generation))
+    else:
+        settings = load_settings(args.settings)
+        trainer = Trainer(settings, num_workers=num_workers, batch=args.batch, seed=args.seed)
+    print('Seed:', trainer.seed)
+    if args.replays and trainer._compiled_game is not None:
+        # Fail now rather than after the first generation (see Trainer.replay_genome)
+        raise Exception("--replays can't be used with 'use_numba' turned on")
+
+    profiler = None
+    if args.profile:
+        from profiling import Profiler
+        profiler = Profiler(args.profile, type(trainer))
+        profiler.enable()
+
+    stats_writer = None
+    if args.stats:
+        # A resumed run picks its stats back up where the checkpoint was saved
+        stats_writer = StatsWriter(args.stats, distributions=args.stats_distributions,
+                                   start_generation=trainer.current_generation if args.resume else None)
+
+    # The default run never ends, so Ctrl-C is how it usually stops. Finish the stats and shut the pool and
+    # shared memory down either way
+    try:
+        while args.generations is None or trainer.current_generation < args.generations:
+            trainer.evaluate_population()
+            if profiler:
+                profiler.count_population(trainer.population)
+            if stats_writer:
+                stats_writer.add_generation(trainer.current_generation, trainer.population)
+            print('======================= Generation {} ======================='.format(trainer.current_generation))
+            print('----Max fitness:', trainer.population.fittest_individual.fitness)
+            print('----Best Score:', trainer.population.fittest_individual.score)
+            print('----Average fitness:', trainer.population.average_fitness)
+            sys.stdout.flush()
+            if args.archive:
+                save_snake_to_archive(args.archive, 'best_snake_gen{}'.format(trainer.current_generation),
+                                      trainer.population.fittest_individual, trainer.settings,
+                                      generation=trainer.current_generation)
+            if args.replays:
+                if not os.path.exists(args.replays):
+                    os.makedirs(args.replays)
+                # Playing the best snake again isn't training, so keep it out of the timers
+                with profiler.paused() if profiler else nullcontext():
+                    replay = trainer.replay_genome(trainer.population.fittest_individual)
+                replay.save(os.path.join(args.replays, 'best_snake_gen{}.npz'.format(trainer.current_generation)))
+            generation = trainer.current_generation
+            trainer.next_generation()
+            if profiler:
+                profiler.end_generation(generation)
+
+            if args.checkpoint and trainer.current_generation % args.checkpoint_every == 0:
+                trainer.save_checkpoint(args.checkpoint)
+    finally:
+        try:
+            # Waits for the generations that are still queued, so they aren't lost on Ctrl-C either
+            if stats_writer:
+                stats_writer.close()
+        finally:
+            trainer.close()
+
+
+if __name__ == '__main__':
+    main()